@@ -0,0 +1,4 @@
+'''
+    @brief  Benchmarks for the vicpack decoder, run from the repository root,
+            e.g. python -m benchmarks.bench_vicpack
+'''
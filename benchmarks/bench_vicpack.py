@@ -0,0 +1,174 @@
+'''
+    @brief  Microbenchmarks for the vicpack decoder
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_vicpack --output results.json
+        python -m benchmarks.bench_vicpack --baseline baseline.json --tolerance 0.10
+
+    Results are written as JSON, one entry per benchmark with calls per second
+    and per-call latency. When a baseline is given, each benchmark is compared
+    against it and the run fails on regressions above the tolerance.
+'''
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+from vicpackdecoder import vicpack as vic
+from vicpackdecoder import encoder
+from vicpackdecoder import decoder
+from vicpackdecoder import validate
+from vicpackdecoder import compact
+from vicpackdecoder import aggregate
+
+from . import packets as gen
+
+
+def measure (function, items, repeat):
+    """
+    @brief              Calls function for every item, repeat times
+    @retval             Best wall time in seconds of one pass over items
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def measure_packs (function, payloads, repeat, **settings):
+    """
+    @brief              Times function over freshly added vicpack instances,
+                        the instances are built outside the timed section
+    """
+    best = None
+    for _ in range(repeat):
+        packs = list()
+        for payload in payloads:
+            pack = vic.vicpack()
+            pack.add(payload)
+            for (name, value) in settings.items():
+                pack.set(name, value)
+            packs.append(pack)
+        elapsed = measure(function, packs, 1)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def result (seconds, calls, packets=None):
+    res = {
+        'calls'         : calls,
+        'seconds'       : seconds,
+        'per_call_us'   : seconds / calls * 1e6,
+        'calls_per_sec' : calls / seconds
+    }
+    if packets:
+        res['packets_per_sec'] = packets / seconds
+    return res
+
+
+def run (count=2000, repeat=5, seed=0):
+    """
+    @brief              Runs all benchmarks
+    @retval             dict of benchmark name to result
+    """
+    rng = random.Random(seed)
+    raw = gen.device_packets(count, rng) + gen.every_type(rng)
+    text = gen.hexlify(raw)
+    results = dict()
+
+    pack = vic.vicpack()
+    results['add.hex'] = result(measure(pack.add, text, repeat), len(text), len(text))
+    results['add.bytes'] = result(measure(pack.add, raw, repeat), len(raw), len(raw))
+    results['export'] = result(measure_packs(vic.vicpack.export, raw, repeat), len(raw), len(raw))
+    results['encoder.dumps'] = result(measure_packs(encoder.dumps, raw, repeat), len(raw), len(raw))
+    generic = decoder.Decoder(shapes=0)
+    shaped = decoder.Decoder()
+    results['decoder.dumps'] = result(measure(generic.dumps, raw, repeat), len(raw), len(raw))
+    results['decoder.export'] = result(measure(generic.export, raw, repeat), len(raw), len(raw))
+    # compiled per packet shape, the first pass compiles
+    results['decoder.shaped.dumps'] = result(measure(shaped.dumps, raw, repeat), len(raw), len(raw))
+    results['decoder.shaped.export'] = result(measure(shaped.export, raw, repeat), len(raw), len(raw))
+    results['validate.check'] = result(measure(validate.check, raw, repeat), len(raw), len(raw))
+    # whole batch per call, reported per packet
+    batch = compact.dumps(raw, generic)
+    results['compact.dumps'] = result(measure(lambda packets: compact.dumps(packets, generic), [raw], repeat), len(raw), len(raw))
+    results['compact.loads'] = result(measure(compact.loads, [batch], repeat), len(raw), len(raw))
+    # 50 devices, all packets in one window
+    aggregator = aggregate.Aggregator(lambda record: None, clock=lambda: 0.0)
+    devices = [('device{}'.format(n % 50), payload) for (n, payload) in enumerate(raw)]
+    seconds = measure(lambda item: aggregator.add(item[0], generic.records(item[1])), devices, repeat)
+    results['aggregate.add'] = result(seconds, len(raw), len(raw))
+    for detail in (True, False):
+        for prefix in (True, False):
+            name = 'str.detail={}.prefix={}'.format(detail, prefix)
+            seconds = measure_packs(str, raw, repeat, detail=detail, prefix=prefix)
+            results[name] = result(seconds, len(raw), len(raw))
+
+    # every converter over a spread of raw values
+    values = [rng.getrandbits(16) for _ in range(500)] + [rng.getrandbits(32) for _ in range(500)]
+    for (key, spec) in sorted(vic.TYPES.items(), key=lambda item: item[1]['type']):
+        seconds = measure(spec['function'], values, repeat)
+        results['convert.' + key] = result(seconds, len(values))
+    return results
+
+
+def compare (results, baseline, tolerance):
+    """
+    @brief              Prints per-call latency against a baseline
+    @retval             Names of benchmarks slower than baseline by more than tolerance
+    """
+    slower = list()
+    print('{:40s} {:>12s} {:>12s} {:>8s}'.format('benchmark', 'baseline us', 'current us', 'ratio'))
+    for (name, res) in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = res['per_call_us'] / base['per_call_us']
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            flag = ' slower'
+        print('{:40s} {:12.3f} {:12.3f} {:8.2f}{}'.format(name, base['per_call_us'], res['per_call_us'], ratio, flag))
+    return slower
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description='vicpack decoder microbenchmarks')
+    parser.add_argument('--count', type=int, default=2000, help='number of device packets')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions, best is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown against baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.count, args.repeat, args.seed)
+    report = {
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'time'      : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'count'     : args.count,
+        'repeat'    : args.repeat,
+        'results'   : results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
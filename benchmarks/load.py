@@ -0,0 +1,261 @@
+'''
+    @brief  End-to-end load harness for the function entry points
+
+    Usage (from the repository root, with the requirements installed):
+        python -m benchmarks.load --rate 2000 --duration 30 --workers 4
+        python -m benchmarks.load --entry main_batch --batch-size 100 --devices climate=3,motion=1
+        python -m benchmarks.load --setting VICPACK_VALIDATE=1 --output load.json
+
+    Builds azure.functions.EventHubEvent objects for a mix of simulated devices
+    and calls the entry point of vicpackdecoder the way the Functions host does,
+    no Azure service is involved. Each worker process runs threads, like the
+    worker thread pool, which call the entry point on an open loop schedule at
+    their share of the target rate (0 runs flat out). Latency is measured from
+    the scheduled start, so queueing behind a slow call is included; service
+    time is the duration of the call alone. Reports throughput, p50/p95/p99
+    and the peak resident memory of the worker processes.
+'''
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import datetime
+import resource
+import threading
+import multiprocessing
+
+from . import packets as gen
+
+
+def device_mix (spec):
+    """
+    @brief              Parses a device mix, e.g. climate=3,motion=1
+    @retval             list of (layout name, weight)
+    """
+    if not spec:
+        return [(name, 1) for name in sorted(gen.DEVICES)]
+    mix = list()
+    for item in spec.split(','):
+        (name, _, weight) = item.partition('=')
+        if name not in gen.DEVICES:
+            raise SystemExit('unknown device layout {}, one of {}'.format(name, ', '.join(sorted(gen.DEVICES))))
+        mix.append((name, int(weight or 1)))
+    return mix
+
+def events (count, mix, devices, seed=0):
+    """
+    @brief              Builds count events from devices simulated devices, the
+                        layout of each device is drawn from the mix
+    @retval             list of azure.functions.EventHubEvent
+    """
+    import azure.functions as func
+
+    rng = random.Random(seed)
+    names = [name for (name, weight) in mix for _ in range(weight)]
+    layouts = [gen.DEVICES[rng.choice(names)] for _ in range(devices)]
+    start = datetime.datetime.now(datetime.timezone.utc)
+    result = list()
+    for n in range(count):
+        device = n % devices
+        payload = gen.device_packet(layouts[device], rng, n // devices)
+        result.append(func.EventHubEvent(
+            body=payload.hex().encode('ascii'),
+            iothub_metadata={'connection-device-id': 'device-{}'.format(device)},
+            enqueued_time=start + datetime.timedelta(milliseconds=n),
+            sequence_number=n))
+    return result
+
+
+def percentiles (values, points=(50, 95, 99)):
+    """
+    @brief              Returns the given percentiles of values, nearest rank
+    """
+    values = sorted(values)
+    if not values:
+        return dict(('p{}'.format(p), None) for p in points)
+    return dict(('p{}'.format(p), values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))]) for p in points)
+
+def peak_rss ():
+    """
+    @brief              Peak resident memory of this process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def worker (config):
+    """
+    @brief              Runs in a worker process: imports the function app with
+                        the given settings and drives the entry point
+    @retval             dict of calls, events, errors, latencies and service times
+    """
+    os.environ.update(config['settings'])
+    import vicpackdecoder as app
+
+    entry = getattr(app, config['entry'])
+    batch = config['batch_size'] if config['entry'] != 'main' else 1
+    pool = events(config['events'], config['mix'], config['devices'], config['seed'])
+    calls = [pool[i:i + batch] for i in range(0, len(pool), batch)]
+    if batch == 1:
+        calls = [group[0] for group in calls]
+    threads = config['threads']
+    # seconds between the calls of one thread, 0 runs flat out
+    interval = threads * batch / config['rate'] if config['rate'] else 0.0
+
+    results = [None] * threads
+    ready = threading.Barrier(threads + 1)
+
+    def loop (index):
+        latencies = list()
+        service = list()
+        errors = 0
+        count = 0
+        ready.wait()
+        start = time.perf_counter()
+        deadline = start + config['duration']
+        scheduled = start + index * interval / threads
+        while True:
+            now = time.perf_counter()
+            if interval:
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+                    now = time.perf_counter()
+            else:
+                scheduled = now
+            if now >= deadline:
+                break
+            call = calls[(count * threads + index) % len(calls)]
+            try:
+                entry(call)
+            except Exception:
+                errors += 1
+            done = time.perf_counter()
+            latencies.append(done - scheduled)
+            service.append(done - now)
+            count += 1
+            scheduled += interval
+        results[index] = (count, errors, latencies, service)
+
+    workers = [threading.Thread(target=loop, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    ready.wait()
+    for thread in workers:
+        thread.join()
+
+    count = sum(r[0] for r in results)
+    return {
+        'calls'     : count,
+        'events'    : count * batch,
+        'errors'    : sum(r[1] for r in results),
+        'latency'   : [v for r in results for v in r[2]],
+        'service'   : [v for r in results for v in r[3]],
+        'peak_rss'  : peak_rss()
+    }
+
+
+def _run_worker (config, queue):
+    try:
+        queue.put(worker(config))
+    except BaseException as e:
+        queue.put({'failure': repr(e)})
+
+
+def run (entry='main', rate=1000.0, duration=10.0, workers=1, threads=1, batch_size=100,
+         mix=None, devices=100, events_per_worker=20000, settings=None, seed=0):
+    """
+    @brief              Runs the load test
+    @param  rate        Target events per second over all workers, 0 for as fast as possible
+    @param  settings    Environment settings of the function app, e.g. {'VICPACK_VALIDATE': '1'}
+    @retval             Report dictionary
+    """
+    configs = [{
+        'entry'         : entry,
+        'rate'          : rate / workers,
+        'duration'      : duration,
+        'threads'       : threads,
+        'batch_size'    : batch_size,
+        'mix'           : mix or device_mix(None),
+        'devices'       : devices,
+        'events'        : events_per_worker,
+        'settings'      : settings or dict(),
+        'seed'          : seed + n
+    } for n in range(workers)]
+    # one process per worker, started together so the workers overlap
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_run_worker, args=(config, queue)) for config in configs]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.monotonic() - start
+    failed = [r for r in results if 'failure' in r]
+    if failed:
+        raise SystemExit('worker failed: {}'.format(failed[0]['failure']))
+
+    latency = [v for r in results for v in r['latency']]
+    service = [v for r in results for v in r['service']]
+    events_done = sum(r['events'] for r in results)
+    report = {
+        'entry'         : entry,
+        'target_rate'   : rate,
+        'duration'      : duration,
+        'workers'       : workers,
+        'threads'       : threads,
+        'batch_size'    : batch_size if entry != 'main' else 1,
+        'calls'         : sum(r['calls'] for r in results),
+        'events'        : events_done,
+        'errors'        : sum(r['errors'] for r in results),
+        'events_per_sec': events_done / duration,
+        'wall_seconds'  : elapsed,
+        'latency_ms'    : dict((k, v * 1e3 if v is not None else None) for (k, v) in percentiles(latency).items()),
+        'service_ms'    : dict((k, v * 1e3 if v is not None else None) for (k, v) in percentiles(service).items()),
+        'peak_rss_mb'   : max(r['peak_rss'] for r in results) / 2**20,
+        'settings'      : settings or dict()
+    }
+    return report
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description='Load test the vicpackdecoder entry points')
+    parser.add_argument('--entry', default='main', help='entry point, main or a batch entry point such as main_batch')
+    parser.add_argument('--rate', type=float, default=1000.0, help='target events per second, 0 for as fast as possible')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker, like PYTHON_THREADPOOL_THREAD_COUNT')
+    parser.add_argument('--batch-size', type=int, default=100, help='events per call of a batch entry point')
+    parser.add_argument('--devices', default=None, help='device mix, e.g. climate=3,motion=1, default all layouts')
+    parser.add_argument('--device-count', type=int, default=100, help='simulated devices per worker')
+    parser.add_argument('--events', type=int, default=20000, help='distinct events per worker, replayed in a loop')
+    parser.add_argument('--setting', action='append', default=[], help='function app setting NAME=VALUE, repeatable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    settings = dict(item.split('=', 1) for item in args.setting)
+    report = run(args.entry, args.rate, args.duration, args.workers, args.threads, args.batch_size,
+                 device_mix(args.devices), args.device_count, args.events, settings, args.seed)
+    report['python'] = platform.python_version()
+    report['platform'] = platform.platform()
+    report['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    print('{entry}: {events} events in {calls} calls, {errors} errors, {events_per_sec:.0f} events/s '
+          '(target {target_rate:.0f})'.format(**report), file=sys.stderr)
+    for name in ('latency_ms', 'service_ms'):
+        if report['calls']:
+            print('{:11s} p50 {p50:.3f}  p95 {p95:.3f}  p99 {p99:.3f}'.format(name, **report[name]), file=sys.stderr)
+    print('peak rss    {:.1f} MiB'.format(report['peak_rss_mb']), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+'''
+    @brief  Synthetic vicpack packet generator for benchmarks
+'''
+import random
+
+from vicpackdecoder import vicpack as vic
+
+
+SOP = 0xfa                          # start of packet
+VERSION = 0x01                      # packet version byte
+
+# realistic device layouts, list of slots as (sensor, [measurement keys])
+DEVICES = {
+    'climate'   : [('SENSOR_SI7050_TEMP', ['temperature']),
+                   ('SENSOR_SI7020_HUMIDITY', ['humidity']),
+                   ('SENSOR_INTERNAL_ADC', ['internal_battery', 'internal_temperature'])],
+    'environment': [('SENSOR_ENVIRONMENTAL', ['voc_iaq', 'voc_temperature', 'voc_humidity', 'voc_pressure',
+                                              'voc_ambient_light', 'voc_sound_level']),
+                   ('SENSOR_INTERNAL_ADC', ['internal_battery'])],
+    'motion'    : [('SENSOR_ACCELEROMETER', ['acceleration_x', 'acceleration_y', 'acceleration_z',
+                                             'accelerometer_status']),
+                   ('SENSOR_INTERNAL_ADC', ['internal_battery'])],
+    'distance'  : [('SENSOR_TOF', ['tof_distance']),
+                   ('SENSOR_SWITCH', ['switch_interrupt']),
+                   ('SENSOR_INTERNAL_ADC', ['internal_battery'])],
+    'terminal'  : [('SENSOR_TERMINAL', ['voltage', 'voltage_diff', 'voltage_ref']),
+                   ('SENSOR_DIGITAL_MIC', ['audio_average', 'audio_max', 'audio_spl']),
+                   ('SENSOR_AMBIENT_LIGHT', ['ambient_light_visible'])],
+}
+
+
+def measurement (typ, value):
+    """
+    Encodes a single measurement, type byte followed by a 32-bit big-endian value
+    """
+    return bytes((typ,)) + (value & 0xFFFFFFFF).to_bytes(4, 'big')
+
+def driver (slot, sensor, index=0, enabled=True):
+    """
+    Encodes a driver_info measurement, sensor is a name from vicpack.SENSORS
+    """
+    value = (vic.SENSORS.index(sensor) << 24) | (slot << 16) | (index << 8) | int(enabled)
+    return measurement(vic.DRIVER_TYPE, value)
+
+def packet (measurements, packet_id=0, request_id=0):
+    """
+    Builds a raw packet from encoded measurements
+    """
+    header = bytes((SOP, VERSION, packet_id & 255, request_id & 255, len(measurements)))
+    return header + b''.join(measurements)
+
+def sample_value (key, rng):
+    """
+    Returns a plausible raw value for a measurement key
+    """
+    if key == 'error_code':
+        return -rng.randrange(len(vic.ERRORS)) & 0xFFFFFFFF
+    if key == 'internal_battery':
+        return rng.randrange(2800000, 3600000)
+    if key == 'app_sw_ver':
+        return (rng.randrange(4) << 16) | (rng.randrange(16) << 8) | rng.randrange(32)
+    if key in ('sampling_time', 'sampling_time_lsb', 'device_id', 'crc_code', 'value_raw'):
+        return rng.getrandbits(32)
+    return rng.getrandbits(16)
+
+def every_type (rng=None):
+    """
+    Returns one packet per known type code, each in its own slot
+    """
+    rng = rng or random.Random(0)
+    packets = list()
+    for (n, (key, spec)) in enumerate(sorted(vic.TYPES.items(), key=lambda item: item[1]['type'])):
+        meas = [driver(0, 'SENSOR_DEBUG', n & 255)]
+        if spec['type'] != vic.DRIVER_TYPE:
+            meas.append(measurement(spec['type'], sample_value(key, rng)))
+        packets.append(packet(meas, n, 0))
+    return packets
+
+def device_packet (layout, rng, packet_id=0):
+    """
+    Builds a multi-slot packet for a device layout from DEVICES
+    """
+    meas = list()
+    for (slot, (sensor, keys)) in enumerate(layout):
+        meas.append(driver(slot, sensor, slot))
+        for key in keys:
+            meas.append(measurement(vic.TYPES[key]['type'], sample_value(key, rng)))
+    return packet(meas, packet_id, rng.randrange(256))
+
+def device_packets (count, rng=None, devices=None):
+    """
+    Returns count packets drawn from a device mix, by default all DEVICES
+    """
+    rng = rng or random.Random(0)
+    layouts = [DEVICES[name] for name in (devices or sorted(DEVICES))]
+    return [device_packet(rng.choice(layouts), rng, n) for n in range(count)]
+
+def hexlify (packets):
+    """
+    Returns packets as hex strings, the format delivered by IoT Hub
+    """
+    return [p.hex() for p in packets]
@@ -0,0 +1,140 @@
+'''
+    @brief  Cold start benchmark of the function app
+
+    Usage (from the repository root, with the requirements installed):
+        python -m benchmarks.startup --repeat 10 --output startup.json
+        python -m benchmarks.startup --setting VICPACK_LUT_PRELOAD=0
+        python -m benchmarks.startup --baseline startup.json --tolerance 0.10
+
+    Each repetition starts a fresh interpreter, like a new function instance,
+    and measures the import of vicpackdecoder, the first and second call of
+    the main entry point and a warm call, with a packet carrying every
+    measurement type. Medians over the repetitions are reported. When a baseline is given, the
+    run fails on regressions above the tolerance.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+
+from vicpackdecoder import vicpack as vic
+
+from . import packets as gen
+
+
+STAGES = ('import_ms', 'first_call_ms', 'second_call_ms', 'warm_call_ms')
+
+
+# runs in the fresh interpreter with the payload as argument, prints the stage timings as JSON;
+# the first call of a shape decodes generically, the following ones compile and use its decoder
+CHILD = """
+import sys, json, time
+start = time.perf_counter()
+import vicpackdecoder as app
+imported = time.perf_counter()
+import azure.functions as func
+payload = sys.argv[1]
+# distinct packet ids, so the decode cache does not answer the later calls
+events = [func.EventHubEvent(body=(payload[:4] + '{:02x}'.format(n) + payload[6:]).encode('ascii')) for n in range(CALLS)]
+timings = list()
+for event in events:
+    call = time.perf_counter()
+    app.main(event)
+    timings.append(time.perf_counter() - call)
+json.dump({
+    'import_ms'         : (imported - start) * 1e3,
+    'first_call_ms'     : timings[0] * 1e3,
+    'second_call_ms'    : timings[1] * 1e3,
+    'warm_call_ms'      : min(timings[2:]) * 1e3
+}, sys.stdout)
+"""
+CALLS = 12
+
+
+def run (repeat=10, settings=None, seed=0):
+    """
+    @brief              Starts repeat fresh interpreters
+    @param  settings    Environment settings of the function app, e.g. {'VICPACK_LUT_PRELOAD': '0'}
+    @retval             dict of stage -> list of milliseconds
+    """
+    rng = random.Random(seed)
+    # one slot with every measurement type, so each converter is used
+    meas = [gen.driver(0, 'SENSOR_DEBUG')]
+    for (key, spec) in sorted(vic.TYPES.items(), key=lambda item: item[1]['type']):
+        if spec['type'] != vic.DRIVER_TYPE:
+            meas.append(gen.measurement(spec['type'], gen.sample_value(key, rng)))
+    payload = gen.packet(meas).hex()
+    env = dict(os.environ)
+    env.update(settings or dict())
+    samples = dict((stage, list()) for stage in STAGES)
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', CHILD.replace('CALLS', str(CALLS)), payload],
+                                env=env, stdout=subprocess.PIPE, check=True).stdout
+        for (stage, value) in json.loads(output).items():
+            samples[stage].append(value)
+    return samples
+
+
+def compare (results, baseline, tolerance):
+    """
+    @brief              Prints the median stage timings against a baseline
+    @retval             Names of stages slower than baseline by more than tolerance
+    """
+    slower = list()
+    print('{:20s} {:>12s} {:>12s} {:>8s}'.format('stage', 'baseline ms', 'current ms', 'ratio'))
+    for stage in STAGES:
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        ratio = results[stage] / base
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append(stage)
+            flag = ' slower'
+        print('{:20s} {:12.3f} {:12.3f} {:8.2f}{}'.format(stage, base, results[stage], ratio, flag))
+    return slower
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description='vicpackdecoder cold start benchmark')
+    parser.add_argument('--repeat', type=int, default=10, help='fresh interpreters, the median is kept')
+    parser.add_argument('--setting', action='append', default=[], help='function app setting NAME=VALUE, repeatable')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown against baseline')
+    args = parser.parse_args(argv)
+
+    settings = dict(item.split('=', 1) for item in args.setting)
+    samples = run(args.repeat, settings, args.seed)
+    results = dict((stage, statistics.median(values)) for (stage, values) in samples.items())
+    report = {
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'time'      : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat'    : args.repeat,
+        'settings'  : settings,
+        'results'   : results,
+        'samples'   : samples
+    }
+    for stage in STAGES:
+        print('{:20s} median {:9.3f} ms  min {:9.3f} ms'.format(stage, results[stage], min(samples[stage])), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+'''
+    @brief  Tests of the windowed aggregation
+
+    Measurements are added with explicit event times, the clock of the
+    Aggregator must not be consulted.
+'''
+import json
+import struct
+import datetime
+import unittest
+
+import azure.functions as func
+
+import vicpackdecoder as app
+from vicpackdecoder import vicpack as vic
+from vicpackdecoder import aggregate
+
+
+START = 1700000000 - 1700000000 % 60       # start of a window of 60 seconds
+SAMPLING_TIME = vic.TYPES['sampling_time']['type']
+
+
+def packet (*values, count=None):
+    # one slot 3 driver entry followed by sampling_time measurements, raw values as is
+    meas = [struct.pack('>BI', vic.DRIVER_TYPE, 3 << 16)] + [struct.pack('>BI', SAMPLING_TIME, value) for value in values]
+    return bytes((0xfa, 1, 0, 0, len(meas) if count is None else count)) + b''.join(meas)
+
+def records (*values, count=None):
+    return vic.iter_packet(packet(*values, count=count), None, True)
+
+def clock ():
+    raise AssertionError('the aggregation must run on event time')
+
+def window (start):
+    return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).isoformat()
+
+
+class AggregatorTest (unittest.TestCase):
+
+    def setUp (self):
+        self.aggregator = aggregate.Aggregator(None, 60.0, clock=clock)
+
+    def drain (self):
+        return [json.loads(record) for record in self.aggregator.drain()]
+
+    def test_rollover (self):
+        self.aggregator.add('dev', records(1, 2), START)
+        self.aggregator.add('dev', records(3), START + 59.9)
+        self.assertEqual(self.drain(), [])
+        # the first event of the next window closes the open one
+        self.aggregator.add('dev', records(10), START + 60)
+        [record] = self.drain()
+        self.assertEqual(record, {
+            'deviceId': 'dev', 'slot': 3, 'sensorType': vic.SENSORS[0], 'key': 'sampling_time', 'unit': ['sec'],
+            'windowStart': window(START), 'windowEnd': window(START + 60),
+            'count': 3, 'min': [1], 'max': [3], 'mean': [2.0], 'last': [3]
+        })
+        self.aggregator.poll(START + 119)
+        self.assertEqual(self.drain(), [])
+        self.aggregator.flush()
+        [record] = self.drain()
+        self.assertEqual((record['windowStart'], record['count'], record['last']), (window(START + 60), 1, [10]))
+        self.assertEqual(self.aggregator.stats(), {'series': 0, 'measurements': 4, 'records': 2, 'evictions': 0, 'late': 0})
+
+    def test_late (self):
+        self.aggregator.add('dev', records(10), START + 60)
+        self.aggregator.add('dev', records(1), START + 5)
+        self.aggregator.add('dev', records(2), START + 50)
+        self.aggregator.add('dev', records(3), START - 10)
+        self.assertEqual(self.drain(), [])
+        # late measurements go out on the next poll, per window of their own, the open window stays
+        self.aggregator.poll(START + 61)
+        late = self.drain()
+        self.assertEqual([(record['windowStart'], record['count'], record['late']) for record in late],
+                         [(window(START - 60), 1, True), (window(START), 2, True)])
+        self.assertEqual(len(self.aggregator), 1)
+        self.assertEqual(self.aggregator.stats()['late'], 3)
+
+    def test_eviction (self):
+        aggregator = aggregate.Aggregator(None, 60.0, max_series=2, clock=clock)
+        aggregator.add('a', records(1), START)
+        aggregator.add('b', records(2), START + 1)
+        aggregator.add('a', records(3), START + 2)
+        # b is the least recently updated series
+        aggregator.add('c', records(4), START + 3)
+        [record] = [json.loads(record) for record in aggregator.drain()]
+        self.assertEqual((record['deviceId'], record['windowStart'], record['partial']), ('b', window(START), True))
+        aggregator.flush()
+        self.assertEqual(sorted((record['deviceId'], record['count']) for record in map(json.loads, aggregator.drain())),
+                         [('a', 2), ('c', 1)])
+        self.assertEqual(aggregator.stats()['evictions'], 1)
+
+    def test_truncated_frame (self):
+        # the count promises more measurements than the frame holds, nothing is aggregated
+        with self.assertRaises(struct.error):
+            self.aggregator.add('dev', records(1, 2, count=5), START)
+        self.assertEqual(len(self.aggregator), 0)
+        self.assertEqual(self.aggregator.stats()['measurements'], 0)
+
+
+class DecodeAggregateTest (unittest.TestCase):
+
+    def setUp (self):
+        self.aggregator = app.AGGREGATOR
+        app.AGGREGATOR = aggregate.Aggregator(None, 60.0, clock=clock)
+
+    def tearDown (self):
+        app.AGGREGATOR = self.aggregator
+
+    def event (self, seconds, *values):
+        return func.EventHubEvent(body=packet(*values).hex().encode('ascii'),
+                                  enqueued_time=datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc))
+
+    def test_enqueued_time (self):
+        # a backlog replayed long after the fact is windowed like live traffic
+        output = app.decode_aggregate([self.event(START + 1, 1), self.event(START + 30, 2)])
+        self.assertEqual(output, [])
+        output = app.decode_aggregate([self.event(START + 61, 3), self.event(START + 20, 4), self.event(START + 62, 5)])
+        records = [json.loads(record) for record in output]
+        self.assertEqual([(record['windowStart'], record['count'], record.get('late', False)) for record in records],
+                         [(window(START), 2, False), (window(START), 1, True)])
+        self.assertEqual(len(app.AGGREGATOR), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+'''
+    @brief  Tests of the output batching
+
+    An OutputBatcher sends into a LocalEventHub, time is driven by an
+    injected clock.
+'''
+import json
+import unittest
+
+import azure.functions as func
+
+import vicpackdecoder as app
+from vicpackdecoder import batching
+
+from test_cache import Clock
+
+
+SAMPLE = 'fa0101000301100002012a000000002a00000000ced399'
+
+
+def doc (n, size=20):
+    # JSON document of exactly size bytes
+    text = json.dumps({'n': n, 'pad': ''})
+    return json.dumps({'n': n, 'pad': 'x' * (size - len(text))})
+
+
+class OutputBatcherTest (unittest.TestCase):
+
+    def setUp (self):
+        self.clock = Clock()
+        self.hub = batching.LocalEventHub(max_message_bytes=100)
+        self.totals = batching.Totals()
+        self.batcher = batching.OutputBatcher(self.hub, 100, 1.0, self.clock, self.totals)
+
+    def test_size (self):
+        # 2 brackets + 4 documents of 20 bytes + 3 commas fit in 100 bytes, the fifth does not
+        docs = [doc(n) for n in range(5)]
+        for d in docs:
+            self.batcher.add(d)
+        self.assertEqual(len(self.hub.messages), 1)
+        self.assertEqual(len(self.hub.messages[0]), 85)
+        self.batcher.flush()
+        self.assertEqual([json.loads(message) for message in self.hub.messages],
+                         [[json.loads(d) for d in docs[:4]], [json.loads(docs[4])]])
+        self.assertEqual(self.batcher.stats()['reasons'], {batching.FLUSH_SIZE: 1, batching.FLUSH_END: 1})
+
+    def test_oversize (self):
+        self.hub.max_message_bytes = 200
+        self.batcher.add(doc(0))
+        self.batcher.add(doc(1, 99))
+        # the oversize record goes alone, after the pending batch
+        self.assertEqual(len(self.batcher), 0)
+        self.assertEqual([len(message) for message in self.hub.messages], [22, 101])
+        self.assertEqual(self.batcher.stats()['reasons'], {batching.FLUSH_SIZE: 1, batching.FLUSH_OVERSIZE: 1})
+        # and the hub refuses it
+        hub = batching.LocalEventHub(max_message_bytes=100)
+        batcher = batching.OutputBatcher(hub, 100, None, self.clock)
+        with self.assertRaisesRegex(ValueError, 'message of 101 bytes exceeds the 100 byte limit'):
+            batcher.add(doc(1, 99))
+
+    def test_latency (self):
+        self.batcher.add(doc(0))
+        self.clock.now += 0.5
+        self.batcher.poll()
+        self.assertEqual(self.hub.messages, [])
+        self.clock.now += 0.5
+        self.batcher.poll()
+        self.assertEqual(len(self.hub.messages), 1)
+        # the age is counted from the oldest pending record
+        self.batcher.add(doc(1))
+        self.clock.now += 1.0
+        self.batcher.add(doc(2))
+        self.assertEqual(len(self.hub.messages), 2)
+        self.assertEqual(self.batcher.stats()['reasons'], {batching.FLUSH_LATENCY: 2})
+
+    def test_end (self):
+        self.batcher.flush()
+        self.assertEqual(self.hub.messages, [])
+        self.batcher.add(doc(0))
+        self.batcher.flush()
+        self.assertEqual(self.hub.messages, ['[' + doc(0) + ']'])
+        self.assertEqual(self.batcher.stats(), {
+            'batches': 1, 'records': 1, 'bytes': 22, 'fill_ratio': 0.22, 'reasons': {batching.FLUSH_END: 1}
+        })
+
+    def test_totals (self):
+        # counters of short-lived batchers add up
+        for n in range(3):
+            batcher = batching.OutputBatcher(self.hub, 100, None, self.clock, self.totals)
+            batcher.add(doc(n, 48))
+            batcher.flush()
+        self.assertEqual(self.totals.stats(), {
+            'batches': 3, 'records': 3, 'bytes': 150, 'fill_ratio': 0.5, 'reasons': {batching.FLUSH_END: 3}
+        })
+
+
+class MainBatchTest (unittest.TestCase):
+
+    def setUp (self):
+        self.batch_bytes = app.BATCH_BYTES
+        app.BATCH_BYTES = 400
+
+    def tearDown (self):
+        app.BATCH_BYTES = self.batch_bytes
+
+    def test_main_batch (self):
+        before = app.stats()['batching']
+        events = [func.EventHubEvent(body=SAMPLE.encode('ascii')) for _ in range(10)]
+        messages = app.main_batch(events)
+        hub = batching.LocalEventHub(max_message_bytes=app.BATCH_BYTES)
+        for message in messages:
+            hub.send(message)
+        records = [record for message in hub.messages for record in json.loads(message)]
+        self.assertEqual(len(records), 10)
+        after = app.stats()['batching']
+        self.assertEqual(after['batches'] - before['batches'], len(messages))
+        self.assertEqual(after['records'] - before['records'], 10)
+        self.assertEqual(after['reasons'].get(batching.FLUSH_END, 0) - before['reasons'].get(batching.FLUSH_END, 0), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
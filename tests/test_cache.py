@@ -0,0 +1,105 @@
+'''
+    @brief  Tests of the decode cache and the duplicate uplink window
+
+    Time is driven by an injected clock.
+'''
+import unittest
+
+from vicpackdecoder import cache
+
+
+class Clock:
+    """
+    Manually advanced clock
+    """
+    def __init__ (self, now=1000.0):
+        self.now = now
+
+    def __call__ (self):
+        return self.now
+
+
+class DecodeCacheTest (unittest.TestCase):
+
+    def setUp (self):
+        self.clock = Clock()
+        self.cache = cache.DecodeCache(size=2, ttl=10.0, clock=self.clock)
+
+    def test_hit_and_miss (self):
+        self.assertIsNone(self.cache.get(b'a'))
+        self.cache.put(b'a', 'A')
+        # bytes-like payloads share the key
+        self.assertEqual(self.cache.get(bytearray(b'a')), 'A')
+        self.assertEqual(self.cache.get(memoryview(b'a')), 'A')
+        self.assertEqual(self.cache.stats(), {'size': 1, 'hits': 2, 'misses': 1, 'evictions': 0})
+
+    def test_ttl_expiry (self):
+        self.cache.put(b'a', 'A')
+        self.clock.now += 9.9
+        self.assertEqual(self.cache.get(b'a'), 'A')
+        self.clock.now += 0.1
+        self.assertIsNone(self.cache.get(b'a'))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats(), {'size': 0, 'hits': 1, 'misses': 1, 'evictions': 1})
+
+    def test_no_expiry (self):
+        entries = cache.DecodeCache(size=2, ttl=None, clock=self.clock)
+        entries.put(b'a', 'A')
+        self.clock.now += 1e9
+        self.assertEqual(entries.get(b'a'), 'A')
+
+    def test_lru_eviction (self):
+        self.cache.put(b'a', 'A')
+        self.cache.put(b'b', 'B')
+        # a becomes the most recently used, b is evicted by c
+        self.assertEqual(self.cache.get(b'a'), 'A')
+        self.cache.put(b'c', 'C')
+        self.assertIsNone(self.cache.get(b'b'))
+        self.assertEqual(self.cache.get(b'a'), 'A')
+        self.assertEqual(self.cache.get(b'c'), 'C')
+        self.assertEqual(self.cache.stats(), {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1})
+
+    def test_put_refreshes (self):
+        self.cache.put(b'a', 'A')
+        self.clock.now += 8
+        self.cache.put(b'a', 'A2')
+        self.clock.now += 8
+        self.assertEqual(self.cache.get(b'a'), 'A2')
+
+
+class DedupWindowTest (unittest.TestCase):
+
+    def setUp (self):
+        self.clock = Clock()
+        self.window = cache.DedupWindow(window=30.0, size=3, clock=self.clock)
+
+    def test_duplicates_dropped (self):
+        key = ('device', 1, 2)
+        self.assertFalse(self.window.seen(key))
+        self.assertTrue(self.window.seen(key))
+        self.assertTrue(self.window.seen(key))
+        self.assertFalse(self.window.seen(('device', 2, 2)))
+        self.assertFalse(self.window.seen(('other', 1, 2)))
+        self.assertEqual(self.window.stats(), {'size': 3, 'hits': 2, 'misses': 3, 'evictions': 0})
+
+    def test_window_expiry (self):
+        self.assertFalse(self.window.seen('a'))
+        self.clock.now += 29.9
+        self.assertTrue(self.window.seen('a'))
+        self.clock.now += 0.1
+        # remembered from the first sighting, repeats do not extend the window
+        self.assertFalse(self.window.seen('a'))
+        self.assertEqual(self.window.stats(), {'size': 1, 'hits': 1, 'misses': 2, 'evictions': 1})
+
+    def test_size_bound (self):
+        for key in 'abcd':
+            self.assertFalse(self.window.seen(key))
+        self.assertEqual(len(self.window), 3)
+        # the oldest key was forgotten
+        self.assertFalse(self.window.seen('a'))
+        self.assertTrue(self.window.seen('d'))
+        self.assertEqual(self.window.stats()['evictions'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+'''
+    @brief  Tests of the compact batch format
+
+    Random packets written with compact.dumps must restore the exports of the
+    generic decoder, and main_compact must return them as one bytes message.
+'''
+import random
+import unittest
+
+import azure.functions as func
+
+import vicpackdecoder as app
+from vicpackdecoder import decoder
+from vicpackdecoder import compact
+
+from test_specialize import random_packet, canonical
+
+
+class CompactTest (unittest.TestCase):
+
+    COUNT   = 2000
+
+    def setUp (self):
+        rng = random.Random(20)
+        self.packets = [random_packet(rng) for _ in range(self.COUNT)]
+
+    def test_round_trip (self):
+        dec = decoder.Decoder()
+        exports = [canonical(dec.export(pck, binary=True)) for pck in self.packets]
+        restored = [canonical(export) for export in compact.loads(compact.dumps(self.packets, dec))]
+        self.assertEqual(restored, exports)
+
+    def test_main_compact (self):
+        dec = decoder.Decoder()
+        exports = [canonical(dec.export(pck, binary=True)) for pck in self.packets[:200]]
+        events = [func.EventHubEvent(body=pck.hex().encode('ascii')) for pck in self.packets[:200]]
+        # a body that is not hex fails to decode and is skipped
+        events.insert(100, func.EventHubEvent(body=b'not a packet'))
+        with self.assertLogs('vicpackdecoder', 'ERROR'):
+            output = app.main_compact(events)
+        self.assertIsInstance(output, bytes)
+        self.assertEqual([canonical(export) for export in compact.loads(output)], exports)
+
+    def test_main_compact_empty (self):
+        output = app.main_compact([])
+        self.assertIsInstance(output, bytes)
+        self.assertEqual(compact.loads(output), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+'''
+    @brief  Tests of the sensor type projection
+
+    The export of a packet decoded with a sensors Projection must hold exactly
+    the slots of the full export whose sensor type was selected, whatever the
+    consumer of the measurement records.
+'''
+import json
+import random
+import struct
+import unittest
+
+from vicpackdecoder import vicpack as vic
+from vicpackdecoder import decoder
+from vicpackdecoder import compact
+
+from test_specialize import random_packet, canonical
+
+
+def selected (export, sensors):
+    return [slot for slot in export['sensors'] if slot['sensorType'] in sensors]
+
+
+class SensorProjectionTest (unittest.TestCase):
+
+    def setUp (self):
+        self.full = decoder.Decoder()
+
+    def check (self, packets, sensors):
+        dec = decoder.Decoder(vic.Projection(sensors=sensors))
+        for pck in packets:
+            expected = selected(self.full.export(pck, binary=True), sensors)
+            self.assertEqual(canonical(dec.export(pck, binary=True)['sensors']), canonical(expected), pck.hex())
+            # the encoder and the compact format follow the same rules
+            self.assertEqual(canonical(json.loads(dec.dumps(pck, binary=True))['sensors']), canonical(expected), pck.hex())
+        restored = compact.loads(compact.dumps(packets, dec))
+        self.assertEqual(canonical([export['sensors'] for export in restored]),
+                         canonical([selected(self.full.export(pck, binary=True), sensors) for pck in packets]))
+
+    def test_driver_in_skipped_slot (self):
+        # a temperature ahead of the driver is not exported, also when the driver's slot is skipped
+        tof = vic.SENSORS.index('SENSOR_TOF')
+        pck = bytes((0xfa, 1, 1, 0, 3)) + b''.join((
+            struct.pack('>BI', vic.TYPES['temperature']['type'], 20),
+            struct.pack('>BI', vic.DRIVER_TYPE, (tof << 24) | (2 << 16)),
+            struct.pack('>BI', vic.TYPES['tof_distance']['type'], 49)))
+        dec = decoder.Decoder(vic.Projection(sensors=[vic.DEFAULT_SENSOR_TYPE]))
+        self.assertEqual(dec.export(pck, binary=True)['sensors'], [])
+        self.assertEqual(list(dec.iter_measurements(pck, binary=True)), [])
+        self.check([pck], [vic.DEFAULT_SENSOR_TYPE])
+        self.check([pck], ['SENSOR_TOF'])
+
+    def test_no_driver (self):
+        # without any driver entry the measurements are exported in the default slot
+        pck = bytes((0xfa, 1, 1, 0, 1)) + struct.pack('>BI', vic.TYPES['temperature']['type'], 20)
+        dec = decoder.Decoder(vic.Projection(sensors=[vic.DEFAULT_SENSOR_TYPE]))
+        self.assertEqual([slot['slot'] for slot in dec.export(pck, binary=True)['sensors']], [vic.DEFAULT_SLOT])
+        self.check([pck], [vic.DEFAULT_SENSOR_TYPE])
+
+    def test_random (self):
+        rng = random.Random(16)
+        packets = [random_packet(rng) for _ in range(1000)]
+        for _ in range(10):
+            sensors = rng.sample(vic.SENSORS + [vic.DEFAULT_SENSOR_TYPE], rng.randrange(1, 4))
+            self.check(packets, sensors)
+
+
+if __name__ == '__main__':
+    unittest.main()
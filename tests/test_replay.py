@@ -0,0 +1,106 @@
+'''
+    @brief  Tests of the memory-mapped archive replay
+
+    Small capture files are written to a temporary directory and replayed
+    through Archive and main.
+'''
+import io
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+from vicpackdecoder import replay
+from vicpackdecoder import validate
+from vicpackdecoder.decoder import DECODER
+
+from test_specialize import random_packet
+
+
+SAMPLE = bytes.fromhex('fa0101000301100002012a000000002a00000000ced399')
+TRAILER = validate.TRAILER  # bytes following the measurements of the sample frame
+
+
+class ReplayTest (unittest.TestCase):
+
+    def setUp (self):
+        self.directory = tempfile.mkdtemp()
+        rng = random.Random(12)
+        # random frames with the trailer of the sample frame
+        self.packets = [SAMPLE] + [random_packet(rng) + bytes(TRAILER) for _ in range(200)]
+
+    def tearDown (self):
+        shutil.rmtree(self.directory)
+
+    def capture (self, data):
+        path = os.path.join(self.directory, 'uplinks.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_round_trip (self):
+        path = self.capture(b''.join(self.packets))
+        with replay.Archive(path, TRAILER) as archive:
+            self.assertEqual(len(archive), sum(len(pck) for pck in self.packets))
+            boundaries = [bytes(frame) for frame in archive.frames()]
+            decoded = list(archive.decode())
+        self.assertEqual(boundaries, self.packets)
+        self.assertEqual(decoded, [(DECODER.dumps(pck, binary=True), None) for pck in self.packets])
+
+    def test_empty_file (self):
+        with replay.Archive(self.capture(b''), TRAILER) as archive:
+            self.assertEqual(len(archive), 0)
+            self.assertEqual(list(archive.decode()), [])
+
+    def test_truncated_last_frame (self):
+        data = SAMPLE * 2 + SAMPLE[:-1]
+        with replay.Archive(self.capture(data), TRAILER) as archive:
+            frames = archive.frames()
+            self.assertEqual(bytes(next(frames)), SAMPLE)
+            self.assertEqual(bytes(next(frames)), SAMPLE)
+            with self.assertRaisesRegex(ValueError, 'truncated frame at offset {}'.format(2 * len(SAMPLE))):
+                next(frames)
+
+    def test_truncated_header (self):
+        with replay.Archive(self.capture(SAMPLE + SAMPLE[:3]), TRAILER) as archive:
+            with self.assertRaisesRegex(ValueError, 'truncated frame header'):
+                list(archive.frames())
+
+    def test_wrong_trailer (self):
+        # without the trailer the second frame does not start with the start of packet byte
+        with replay.Archive(self.capture(SAMPLE * 2), 0) as archive:
+            with self.assertRaisesRegex(ValueError, 'no start of packet at offset {}'.format(len(SAMPLE) - TRAILER)):
+                list(archive.frames())
+
+    def test_empty_frame (self):
+        with replay.Archive(self.capture(SAMPLE + bytes((0xfa, 1, 0, 0, 0))), TRAILER) as archive:
+            with self.assertRaisesRegex(ValueError, 'frame without measurements'):
+                list(archive.frames())
+
+    def test_main (self):
+        # the middle frame names an unknown sensor type and fails to decode
+        bad = bytes((0xfa, 1, 2, 0, 1, 1, 0xff, 0, 0, 0)) + bytes(TRAILER)
+        path = self.capture(SAMPLE + bad + SAMPLE)
+        output = os.path.join(self.directory, 'decoded.ndjson')
+        errors = os.path.join(self.directory, 'failed.ndjson')
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = replay.main([path, '--trailer', str(TRAILER), '--output', output, '--errors', errors])
+        self.assertEqual(status, 0)
+        with open(output) as f:
+            self.assertEqual(f.read().splitlines(), [DECODER.dumps(SAMPLE, binary=True)] * 2)
+        with open(errors) as f:
+            failed = [json.loads(line) for line in f]
+        self.assertEqual([record['payload'] for record in failed], [bad.hex()])
+
+    def test_main_stops_on_lost_framing (self):
+        path = self.capture(SAMPLE * 2)
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = replay.main([path, '--trailer', '0', '--output', os.path.join(self.directory, 'decoded.ndjson')])
+        self.assertEqual(status, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+'''
+    @brief  Regression tests of the compiled shape decoders
+
+    Usage (from the repository root):
+        python -m pytest tests
+        python -m unittest discover tests
+
+    Random packets are decoded by a Decoder with the shape cache and compared
+    with the generic path, encoder.encode and vicpack.build_export, with and
+    without a Projection. Each packet is decoded several times so its shape
+    gets compiled.
+'''
+import json
+import random
+import struct
+import unittest
+
+from vicpackdecoder import vicpack as vic
+from vicpackdecoder import encoder
+from vicpackdecoder import decoder
+
+
+KNOWN = [code for code in range(256) if vic.TYPE_TABLE[code] is not None and code != vic.DRIVER_TYPE]
+UNKNOWN = [code for code in range(256) if vic.TYPE_TABLE[code] is None]
+
+
+def random_packet (rng):
+    """
+    Returns a raw packet of random shape: driver entries of random sensors and
+    slots, known and a few unknown type codes, random 32-bit values
+    """
+    meas = list()
+    for _ in range(rng.randrange(1, 12)):
+        roll = rng.random()
+        if roll < 0.2:
+            value = (rng.randrange(len(vic.SENSORS)) << 24) | (rng.randrange(8) << 16) | (rng.randrange(256) << 8) | rng.randrange(2)
+            meas.append(struct.pack('>BI', vic.DRIVER_TYPE, value))
+        elif roll < 0.25:
+            meas.append(struct.pack('>BI', rng.choice(UNKNOWN), rng.getrandbits(32)))
+        else:
+            meas.append(struct.pack('>BI', rng.choice(KNOWN), rng.getrandbits(32)))
+    header = bytes((0xfa, 1, rng.randrange(256), rng.randrange(256), len(meas)))
+    return header + b''.join(meas)
+
+def canonical (value):
+    # NaN results compare unequal to themselves, compare the serialized form
+    return json.dumps(value, sort_keys=True)
+
+
+class ShapeTest (unittest.TestCase):
+
+    COUNT   = 2000
+    REPEAT  = 3             # decodes per packet, the shape is compiled on the second
+
+    def setUp (self):
+        rng = random.Random(20)
+        self.packets = [random_packet(rng) for _ in range(self.COUNT)]
+
+    def check (self, projection):
+        dec = decoder.Decoder(projection)
+        for pck in self.packets:
+            records = list(vic.iter_packet(pck, projection, True))
+            doc = encoder.encode(records, pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID])
+            export = canonical(vic.build_export(records, pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID]))
+            for _ in range(self.REPEAT):
+                self.assertEqual(dec.dumps(pck, binary=True), doc, pck.hex())
+                self.assertEqual(canonical(dec.export(pck, binary=True)), export, pck.hex())
+        self.assertGreater(dec.stats()['compiles'], 0)
+
+    def test_all_types (self):
+        self.check(None)
+
+    def test_projection_types (self):
+        self.check(vic.Projection(types=KNOWN[::3]))
+
+    def test_projection_keys (self):
+        self.check(vic.Projection(keys=['internal_battery', 'temperature', 'tof_distance']))
+
+
+if __name__ == '__main__':
+    unittest.main()
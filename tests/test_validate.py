@@ -0,0 +1,115 @@
+'''
+    @brief  Tests of the frame validation and the quarantine
+
+    Frames carry the device trailer, one byte and the CRC16 of the frame, see
+    validate. Time of the quarantine warnings is driven by an injected clock.
+'''
+import json
+import struct
+import logging
+import unittest
+
+from vicpackdecoder import vicpack as vic
+from vicpackdecoder import validate
+
+from test_cache import Clock
+
+
+SAMPLE = bytes.fromhex('fa0101000301100002012a000000002a00000000ced399')
+
+
+def frame (*measurements, count=None):
+    # frame with the device trailer of the sample frame
+    body = bytes((validate.SOP, 1, 7, 0, len(measurements) if count is None else count))
+    body += b''.join(struct.pack('>BI', typ, value) for (typ, value) in measurements) + b'\xce'
+    return body + validate.crc16(body).to_bytes(validate.CRC_SIZE, 'big')
+
+
+class CheckTest (unittest.TestCase):
+
+    def test_crc_model (self):
+        # CRC-16/ARC check value and the CRC of the sample frame
+        self.assertEqual(validate.crc16(b'123456789'), 0xbb3d)
+        self.assertEqual(validate.crc16(SAMPLE[:-2]), 0xd399)
+
+    def test_valid (self):
+        self.assertIsNone(validate.check(SAMPLE, validate.TRAILER))
+        self.assertIsNone(validate.check(frame((vic.TYPES['temperature']['type'], 20)), validate.TRAILER))
+        # without trailer neither the length of the sample frame nor a CRC apply
+        self.assertIsNone(validate.check(SAMPLE[:-validate.TRAILER]))
+        self.assertEqual(validate.check_payload(SAMPLE.hex(), validate.TRAILER), (SAMPLE, None))
+
+    def test_header (self):
+        self.assertEqual(validate.check(SAMPLE[:4], validate.TRAILER), validate.REASON_HEADER)
+        self.assertEqual(validate.check(b'\xfb' + SAMPLE[1:], validate.TRAILER), validate.REASON_HEADER)
+
+    def test_version (self):
+        self.assertIsNone(validate.check(SAMPLE, validate.TRAILER, versions=(1,)))
+        self.assertEqual(validate.check(SAMPLE, validate.TRAILER, versions=(2,)), validate.REASON_VERSION)
+
+    def test_length (self):
+        self.assertEqual(validate.check(SAMPLE[:-1], validate.TRAILER), validate.REASON_LENGTH)
+        self.assertEqual(validate.check(SAMPLE + b'\x00', validate.TRAILER), validate.REASON_LENGTH)
+        self.assertEqual(validate.check(SAMPLE, 0), validate.REASON_LENGTH)
+        # the decoder reads at least one measurement
+        self.assertEqual(validate.check(frame(), validate.TRAILER), validate.REASON_LENGTH)
+        self.assertEqual(validate.check(frame((vic.TYPES['temperature']['type'], 20), count=2), validate.TRAILER),
+                         validate.REASON_LENGTH)
+
+    def test_type (self):
+        unknown = next(code for code in range(256) if vic.TYPE_TABLE[code] is None)
+        pck = frame((vic.TYPES['temperature']['type'], 20), (unknown, 0))
+        self.assertEqual(validate.check(pck, validate.TRAILER), validate.REASON_TYPE)
+
+    def test_driver (self):
+        pck = frame((vic.DRIVER_TYPE, len(vic.SENSORS) << 24), (vic.TYPES['temperature']['type'], 20))
+        self.assertEqual(validate.check(pck, validate.TRAILER), validate.REASON_DRIVER)
+        pck = frame((vic.DRIVER_TYPE, (len(vic.SENSORS) - 1) << 24), (vic.TYPES['temperature']['type'], 20))
+        self.assertIsNone(validate.check(pck, validate.TRAILER))
+
+    def test_crc (self):
+        for pos in (2, 10, len(SAMPLE) - 3, len(SAMPLE) - 1):
+            pck = bytearray(SAMPLE)
+            pck[pos] ^= 0x01
+            self.assertEqual(validate.check(pck, validate.TRAILER), validate.REASON_CRC, pos)
+
+    def test_encoding (self):
+        for payload in ('fa0', 'zz', SAMPLE.hex()[:-1]):
+            self.assertEqual(validate.check_payload(payload, validate.TRAILER), (None, validate.REASON_ENCODING))
+
+
+class QuarantineTest (unittest.TestCase):
+
+    def setUp (self):
+        self.clock = Clock()
+
+    def test_sink (self):
+        records = list()
+        quarantine = validate.Quarantine(records.append, clock=self.clock)
+        record = quarantine.add(SAMPLE, validate.REASON_CRC, 'dev')
+        self.assertEqual(records, [record])
+        self.assertEqual(json.loads(record), {'deviceId': 'dev', 'payload': SAMPLE.hex(), 'reason': validate.REASON_CRC})
+        # a sink given per frame takes precedence
+        other = list()
+        quarantine.add(b'fa01', validate.REASON_HEADER, 'dev', other.append)
+        self.assertEqual([json.loads(record)['payload'] for record in other], ['fa01'])
+        self.assertEqual(quarantine.stats(), {'frames': 2, 'reasons': {validate.REASON_CRC: 1, validate.REASON_HEADER: 1}})
+
+    def test_rate_limit (self):
+        quarantine = validate.Quarantine(log_interval=60.0, clock=self.clock)
+        with self.assertLogs('vicpackdecoder', logging.WARNING) as logs:
+            for _ in range(100):
+                self.assertIsNone(quarantine.add(SAMPLE, validate.REASON_CRC, 'dev'))
+                self.clock.now += 0.5
+            # 50 seconds later the next frame warns again, counting the frames in between
+            self.clock.now += 10.0
+            quarantine.add(b'fa01', validate.REASON_HEADER, 'dev')
+        warnings = [record.getMessage() for record in logs.records if record.levelno == logging.WARNING]
+        self.assertEqual(len(warnings), 2)
+        self.assertIn('(0 more since the last warning)', warnings[0])
+        self.assertIn('(99 more since the last warning)', warnings[1])
+        self.assertEqual(quarantine.stats(), {'frames': 101, 'reasons': {validate.REASON_CRC: 100, validate.REASON_HEADER: 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,379 @@
-import logging
+import os
+from typing import List, Optional, Tuple
 #import vicpack as vic
 from . import vicpack as vic #as vic #(explicit relative)
+from . import encoder
+from . import decoder
+from . import specialize
+from . import validate
+from . import diagnostics
+from . import cache
+from . import batching
+from . import metrics
+from .diagnostics import logger, lazy
 
 import azure.functions as func
 
 
-def main(event: func.EventHubEvent) -> str:
-    #logging.info('Python EventHub trigger processed an event: %s', event.get_body().decode('utf-8'))
-    logging.info('WOPS: %s', event.get_body())
+# decoded output of recently seen payloads, VICPACK_CACHE_SIZE=0 disables
+CACHE_SIZE = int(os.environ.get('VICPACK_CACHE_SIZE') or 1024)
+CACHE_TTL = float(os.environ.get('VICPACK_CACHE_TTL') or 300)
+# drop repeats of (device, packetId, requestId) seen within this many seconds, 0 disables
+DEDUP_WINDOW = float(os.environ.get('VICPACK_DEDUP_WINDOW') or 0)
+# batch mode: pack records into JSON array messages of at most this many bytes, 0 disables;
+# the batcher lives for one invocation, which bounds how long a record waits
+BATCH_BYTES = int(os.environ.get('VICPACK_BATCH_BYTES') or 0)
+# validate frames before decoding and quarantine bad ones, VICPACK_VALIDATE=1 enables
+VALIDATE = (os.environ.get('VICPACK_VALIDATE') or '0') not in ('0', 'false', 'False')
+# bytes following the last measurement of a frame, checked by the validation
+FRAME_TRAILER = int(os.environ.get('VICPACK_FRAME_TRAILER') or validate.TRAILER)
+# compiled decoders kept per packet shape (type code sequence), 0 disables
+SHAPE_CACHE_SIZE = int(os.environ.get('VICPACK_SHAPE_CACHE') or specialize.CACHE_SIZE)
+
+# 16-bit converter lookup tables to use: all, none or a comma separated list of names
+LOOKUP_TABLES = os.environ.get('VICPACK_LUT') or 'all'
+if LOOKUP_TABLES in ('all', 'none'):
+    vic.enable_lookup_tables(LOOKUP_TABLES)
+else:
+    vic.enable_lookup_tables(name.strip() for name in LOOKUP_TABLES.split(',') if name.strip())
+# lookup tables built at import instead of in the first invocation: all (1), none (0) or a comma
+# separated list of names, by default the ones worth it, see vicpack.PRELOAD_TABLES
+LUT_PRELOAD = os.environ.get('VICPACK_LUT_PRELOAD') or ','.join(vic.PRELOAD_TABLES)
+if LUT_PRELOAD in ('0', 'false', 'False'):
+    LUT_PRELOAD = 'none'
+elif LUT_PRELOAD in ('1', 'true', 'True'):
+    LUT_PRELOAD = 'all'
+if LUT_PRELOAD in ('all', 'none'):
+    vic.build_lookup_tables(LUT_PRELOAD)
+else:
+    vic.build_lookup_tables(name.strip() for name in LUT_PRELOAD.split(',') if name.strip())
+# run warmup() at import, for hosting plans without the warmup trigger, VICPACK_WARMUP=1 enables
+WARMUP = (os.environ.get('VICPACK_WARMUP') or '0') not in ('0', 'false', 'False')
+
+def _setting_list(name):
+    value = os.environ.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+# decode only these type codes, measurement keys and/or sensor types (comma separated)
+PROJECTION = None
+if any(os.environ.get(name) for name in ('VICPACK_PROJECTION_TYPES', 'VICPACK_PROJECTION_KEYS', 'VICPACK_PROJECTION_SENSORS')):
+    PROJECTION = vic.Projection(
+        types=_setting_list('VICPACK_PROJECTION_TYPES'),
+        keys=_setting_list('VICPACK_PROJECTION_KEYS'),
+        sensors=_setting_list('VICPACK_PROJECTION_SENSORS'))
+
+# batch mode: forward per-series summaries over tumbling windows of this many seconds
+# instead of every measurement, 0 disables. VICPACK_AGGREGATE_RAW=1 also forwards the packets
+AGGREGATE_WINDOW = float(os.environ.get('VICPACK_AGGREGATE_WINDOW') or 0)
+AGGREGATE_KEYS = _setting_list('VICPACK_AGGREGATE_KEYS')
+AGGREGATE_SERIES = int(os.environ.get('VICPACK_AGGREGATE_SERIES') or 0)
+AGGREGATE_RAW = (os.environ.get('VICPACK_AGGREGATE_RAW') or '0') not in ('0', 'false', 'False')
+
+# per stage decode instrumentation, VICPACK_METRICS=1 enables
+metrics.enable((os.environ.get('VICPACK_METRICS') or '0') not in ('0', 'false', 'False'))
+
+CACHE = cache.DecodeCache(CACHE_SIZE, CACHE_TTL) if CACHE_SIZE > 0 else None
+DEDUP = cache.DedupWindow(DEDUP_WINDOW) if DEDUP_WINDOW > 0 else None
+# flush counters of the per invocation output batchers
+BATCHES = batching.Totals()
+# window state is kept by the instance between invocations
+AGGREGATOR = None
+if AGGREGATE_WINDOW > 0:
+    # only imported when enabled, like compact, to keep the cold start short
+    from . import aggregate
+    AGGREGATOR = aggregate.Aggregator(None, AGGREGATE_WINDOW, AGGREGATE_SERIES or aggregate.MAX_SERIES, AGGREGATE_KEYS)
+# rejected frames, logged unless an entry point routes them to the quarantine output
+QUARANTINE = validate.Quarantine()
+# stateless decoder shared by all invocations and worker threads
+DECODER = decoder.Decoder(PROJECTION, SHAPE_CACHE_SIZE)
+
+
+def stats() -> dict:
+    """
+    Returns hit, miss and eviction counters of the decode cache, dedup window and
+    compiled shape cache, the output batch flush counters, and the decode metrics
+    when instrumentation is enabled
+    """
+    return {
+        'cache': CACHE.stats() if CACHE is not None else None,
+        'dedup': DEDUP.stats() if DEDUP is not None else None,
+        'batching': BATCHES.stats() if BATCH_BYTES > 0 else None,
+        'shapes': DECODER.stats(),
+        'quarantine': QUARANTINE.stats() if VALIDATE else None,
+        'aggregate': AGGREGATOR.stats() if AGGREGATOR is not None else None,
+        'metrics': metrics.snapshot() if metrics.enabled else None
+    }
+
+
+def prometheus() -> str:
+    """
+    Returns the decode metrics in Prometheus text format
+    """
+    return metrics.prometheus(dict((spec['type'], key) for (key, spec) in vic.TYPES.items()))
+
+
+def device_id(event: func.EventHubEvent) -> Optional[str]:
+    """
+    Returns the IoT Hub device id of the event, if known
+    """
+    metadata = event.iothub_metadata
+    return metadata.get('connection-device-id') if metadata else None
+
+
+def event_time(event: func.EventHubEvent) -> Optional[float]:
+    """
+    Returns the enqueued time of the event in seconds since the epoch, if known
+    """
+    enqueued = event.enqueued_time
+    return enqueued.timestamp() if enqueued is not None else None
+
+
+def admit(body, device=None, quarantine=None) -> Tuple[bool, Optional[bytes]]:
+    """
+    Returns (False, ...) when the packet repeats a recent uplink of the same device
+    or, with VICPACK_VALIDATE set, is malformed. Malformed frames are passed to
+    the quarantine sink, see validate.Quarantine. The second item is the packet
+    buffer when the checks had to parse the body, None otherwise.
+    """
+    buf = None
+    if VALIDATE:
+        (buf, reason) = validate.check_payload(body, FRAME_TRAILER)
+        if reason is not None:
+            QUARANTINE.add(body, reason, device, quarantine)
+            return (False, None)
+
+    if DEDUP is not None and device is not None:
+        if buf is None:
+            buf = vic.payload_buffer(body)
+        if DEDUP.seen((device, buf[vic.PACKET_INDEX], buf[vic.PACKET_REQUESTID])):
+            logger.debug('dropped duplicate packet %d from %s', buf[vic.PACKET_INDEX], device)
+            return (False, buf)
+    return (True, buf)
+
+
+def decode(body, device=None, quarantine=None, screen=True) -> Optional[str]:
+    """
+    Decodes a single event body and returns the exported packet as JSON,
+    or None when the packet is not admitted, see admit. With screen False
+    every packet is decoded, without validation and duplicate suppression.
+    """
+    buf = None
+    if screen:
+        (admitted, buf) = admit(body, device, quarantine)
+        if not admitted:
+            return None
+
+    if CACHE is not None:
+        doc = CACHE.get(body)
+        if doc is not None:
+            return doc
+
+    if diagnostics.enabled():
+        logger.debug('payload %s', body)
+        logger.debug('%s', lazy(dump, body))
+    if buf is not None:
+        doc = DECODER.dumps(buf, binary=True)
+    else:
+        doc = DECODER.dumps(body)   # hex text or raw binary
+    if CACHE is not None:
+        CACHE.put(body, doc)
+    return doc
+
+
+def dump(body) -> str:
+    """
+    Returns the human readable dump of a packet, for debug logging
+    """
     pack = vic.vicpack()        # instantiate a vicpack class parser
-    pack.add(event.get_body().decode('utf-8'))     # add measurement
+    pack.projection = PROJECTION    # decode selected measurements only, None for all
+    pack.add(body)              # add measurement, hex text or raw binary
     pack.detail = True          # when self.__str__ is invoked, print all packet contents
     pack.prefix = False         # do not invoke SI-prefix parser
+    return str(pack)
+
+
+def timed_decode(body, device=None, quarantine=None, screen=True) -> Optional[str]:
+    """
+    Same as decode, recording the event stage when instrumentation is enabled
+    """
+    if not metrics.enabled:
+        return decode(body, device, quarantine, screen)
+    start = metrics.clock()
+    try:
+        return decode(body, device, quarantine, screen)
+    finally:
+        metrics.observe(metrics.STAGE_EVENT, metrics.clock() - start)
+
+
+def main(event: func.EventHubEvent) -> str:
+    """
+    Single event entry point ("cardinality": "one", see function.sample.json).
+    The $return output has to be a str, an event cannot be dropped, so
+    validation and duplicate suppression only apply to the batch entry points.
+    """
+    #logging.info('Python EventHub trigger processed an event: %s', event.get_body().decode('utf-8'))
+    return timed_decode(event.get_body(), device_id(event), screen=False)
+
+
+def decode_batch(events, quarantine=None) -> List[str]:
+    """
+    Decodes a batch of events in delivery order, so partition ordering is kept.
+    A packet which fails to decode is logged and skipped without failing the
+    whole batch, duplicate uplinks are dropped. With VICPACK_BATCH_BYTES set,
+    records are returned as JSON array messages bounded by that size instead
+    of one per packet.
+    """
+    logger.debug('batch of %d events', len(events))
+    output = list()
+    batcher = None
+    if BATCH_BYTES > 0:
+        batcher = batching.OutputBatcher(output.append, BATCH_BYTES, None, totals=BATCHES)
+    for event in events:
+        try:
+            doc = timed_decode(event.get_body(), device_id(event), quarantine)
+        except Exception:
+            logger.exception('Failed to decode event: %s', event.get_body())
+            continue
+        if doc is None:
+            continue
+        if batcher is not None:
+            batcher.add(doc)
+        else:
+            output.append(doc)
+    if batcher is not None:
+        batcher.flush()
+        logger.debug('output %s', lazy(batcher.stats))
+    logger.debug('stats %s', lazy(stats))
+    return output
+
+
+def decode_compact(events, quarantine=None) -> bytes:
+    """
+    Same as decode_batch, returning the records of all events as one compact
+    binary message (see compact), without records when none was decoded
+    """
+    from . import compact
+    writer = compact.Writer()
+    for event in events:
+        body = event.get_body()
+        try:
+            (admitted, pck) = admit(body, device_id(event), quarantine)
+            if not admitted:
+                continue
+            pck = DECODER.buffer(body) if pck is None else DECODER.buffer(pck, True)
+            writer.add(DECODER.records(pck), pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID])
+        except Exception:
+            logger.exception('Failed to decode event: %s', body)
+    logger.debug('stats %s', lazy(stats))
+    return writer.getvalue()
+
+
+def decode_aggregate(events, quarantine=None) -> List[str]:
+    """
+    Same as decode_batch, feeding the measurements to the window aggregation
+    and returning the summary records of the windows closed so far, including
+    late ones, followed by the packets themselves with VICPACK_AGGREGATE_RAW set
+    """
+    raw = list()
+    latest = None
+    for event in events:
+        body = event.get_body()
+        device = device_id(event)
+        timestamp = event_time(event)
+        if timestamp is None:
+            timestamp = AGGREGATOR.clock()
+        if latest is None or timestamp > latest:
+            latest = timestamp
+        try:
+            (admitted, pck) = admit(body, device, quarantine)
+            if not admitted:
+                continue
+            pck = DECODER.buffer(body) if pck is None else DECODER.buffer(pck, True)
+            AGGREGATOR.add(device, DECODER.records(pck), timestamp)
+            if AGGREGATE_RAW:
+                raw.append(DECODER.dumps(pck, binary=True))
+        except Exception:
+            logger.exception('Failed to decode event: %s', body)
+    # windows advance on event time only, the wall clock would move them ahead of a backlog
+    if latest is not None:
+        AGGREGATOR.poll(latest)
+    logger.debug('stats %s', lazy(stats))
+    return AGGREGATOR.drain() + raw
+
+
+def main_batch(events: List[func.EventHubEvent]) -> List[str]:
+    """
+    Batch entry point, used with "cardinality": "many" (see function.batch.sample.json),
+    see decode_batch, or decode_aggregate with VICPACK_AGGREGATE_WINDOW set
+    """
+    if AGGREGATOR is not None:
+        return decode_aggregate(events)
+    return decode_batch(events)
+
+
+def main_quarantine(events: List[func.EventHubEvent], quarantine: func.Out[List[str]]) -> List[str]:
+    """
+    Batch entry point with a second output for malformed frames, used with
+    VICPACK_VALIDATE=1 (see function.quarantine.sample.json)
+    """
+    rejected = list()
+    if AGGREGATOR is not None:
+        output = decode_aggregate(events, rejected.append)
+    else:
+        output = decode_batch(events, rejected.append)
+    if rejected:
+        quarantine.set(rejected)
+    return output
+
+
+def main_compact(events: List[func.EventHubEvent]) -> bytes:
+    """
+    Batch entry point returning one compact binary message per invocation
+    (see function.compact.sample.json), see decode_compact. The Event Hub
+    output takes a single bytes message, not a list of them.
+    """
+    return decode_compact(events)
+
+
+def main_compact_quarantine(events: List[func.EventHubEvent], quarantine: func.Out[List[str]]) -> bytes:
+    """
+    Same as main_compact with a second output for malformed frames, see main_quarantine
+    """
+    rejected = list()
+    output = decode_compact(events, rejected.append)
+    if rejected:
+        quarantine.set(rejected)
+    return output
+
+
+def warmup(warmupContext=None) -> None:
+    """
+    Warm-up entry point, used with the warmupTrigger binding of instances added
+    by scale out on the Premium and Dedicated plans (see warmup/function.sample.json),
+    or at import with VICPACK_WARMUP=1. Builds the lookup tables and decodes a
+    packet of every measurement type once, so the first uplink does not pay for
+    it. Metrics are paused meanwhile, so run it before the instance gets traffic;
+    counters and cached output are left untouched.
+    """
+    start = metrics.clock()
+    instrumented = metrics.enabled
+    metrics.enable(False)
+    try:
+        vic.build_lookup_tables()
+        codes = [code for code in range(256) if vic.TYPE_TABLE[code] is not None]
+        # one measurement of every known type, driver entry included, all values zero
+        pck = bytearray((validate.SOP, 0, 0, 0, len(codes)))
+        for code in codes:
+            pck += vic.MEASUREMENT.pack(code, 0)
+        records = list(vic.iter_packet(pck, PROJECTION, drivers=True))
+        encoder.encode(records, pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID])
+        vic.build_export(records, pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID])
+    finally:
+        metrics.enable(instrumented)
+    logger.info('warm-up done in %.1f ms', (metrics.clock() - start) * 1e3)
+
 
-    print(pack)
-    print(pack.export ())
-    return "{}".format(pack.export())
\ No newline at end of file
+if WARMUP:
+    warmup()
@@ -0,0 +1,248 @@
+'''
+    @brief  Windowed aggregation of decoded measurements
+
+    Instead of forwarding every measurement, Aggregator keeps running count,
+    min, max, sum and last value per series, a series being one measurement
+    key of one slot and sensor type of one device, over tumbling windows
+    aligned to multiples of the window length. When a window closes one
+    summary record per series is handed to the sink. Memory is constant per
+    series; at most max_series series are kept, when a new series would
+    exceed that, the least recently updated one is emitted early, marked
+    partial. Windows only advance on the timestamps passed in, so replaying a
+    backlog yields the same windows as live traffic. Measurements whose
+    timestamp falls before the open window are late: they are aggregated per
+    window of their own and emitted, marked late, on the next poll or flush,
+    to be merged downstream.
+'''
+import json
+import time
+import datetime
+import threading
+import collections
+
+from . import vicpack as vic
+
+
+WINDOW      = 60.0              # seconds
+MAX_SERIES  = 100000
+
+
+class Series:
+    """
+    Running aggregate of one series, values are per component
+    of the measurement value
+    """
+    __slots__ = ('unit', 'count', 'min', 'max', 'sum', 'last')
+
+    def __init__ (self, unit, values):
+        self.unit   = unit
+        self.count  = 1
+        self.min    = list(values)
+        self.max    = list(values)
+        self.sum    = list(values)
+        self.last   = values
+
+    def update (self, values):
+        self.count += 1
+        for (i, value) in enumerate(values):
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+            self.sum[i] += value
+        self.last = values
+
+
+def _timestamp (seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+def _exported (records):
+    """
+    Yields the measurement records which vicpack.export exports: measurements
+    ahead of the first driver entry only when the packet has no driver entry
+    """
+    pending = list()
+    driver = False
+    for rec in records:
+        if rec.type == vic.DRIVER_TYPE:
+            driver = True
+            pending = None
+        elif driver:
+            yield rec
+        else:
+            pending.append(rec)
+    if not driver:
+        for rec in pending:
+            yield rec
+
+
+class Aggregator:
+    """
+    Tumbling window aggregation, summary records are JSON documents passed
+    to sink (any callable taking the record), or kept until drain() when
+    there is no sink
+    """
+    def __init__ (self, sink=None, window=WINDOW, max_series=MAX_SERIES, keys=None, clock=time.time):
+        """
+        @param  sink        Receives one JSON summary record per series and window,
+                            None keeps them for drain()
+        @param  window      Window length in seconds
+        @param  max_series  Maximum number of series kept in memory
+        @param  keys        Measurement keys to aggregate, None for all
+        @param  clock       Time source when add is given no timestamp
+        """
+        self.sink       = sink
+        self.window     = window
+        self.max_series = max_series
+        self.keys       = frozenset(keys) if keys is not None else None
+        self.clock      = clock
+
+        self.measurements   = 0     # measurements aggregated
+        self.records        = 0     # summary records emitted
+        self.evictions      = 0     # series emitted early
+        self.late           = 0     # measurements older than the open window
+
+        self.__start    = None      # start of the open window
+        self.__series   = collections.OrderedDict()     # (device, slot, sensorType, key) -> Series
+        self.__late     = dict()    # (window start, series name) -> Series, late measurements
+        self.__emitted  = list()    # summary records not yet drained, without sink
+        self.__lock     = threading.Lock()
+
+    def __len__ (self):
+        return len(self.__series)
+
+    def add (self, device, records, timestamp=None):
+        """
+        @brief              Aggregates the measurements of a packet
+        @param  device      Device id
+        @param  records     Measurement records including driver entries,
+                            see vicpack.iter_packet
+        @param  timestamp   Event time in seconds since the epoch, defaults to clock()
+        """
+        now = self.clock() if timestamp is None else timestamp
+        keys = self.keys
+        # walk the whole packet first, a frame failing halfway is not aggregated at all
+        records = list(_exported(records))
+        with self.__lock:
+            self.__advance(now)
+            start = now - now % self.window
+            if start < self.__start:
+                self.__add_late(device, records, start)
+                return
+            series = self.__series
+            for rec in records:
+                if vic.TYPE_TABLE[rec.type] is None or (keys is not None and rec.key not in keys):
+                    continue
+                value = rec.value
+                values = value if type(value) == tuple else (value,)
+                name = (device, rec.sensor.slot, rec.sensor.sensorType, rec.key)
+                entry = series.get(name)
+                if entry is None:
+                    if len(series) >= self.max_series:
+                        (old, oldest) = series.popitem(last=False)
+                        self.__emit(old, oldest, self.__start, partial=True)
+                        self.evictions += 1
+                    series[name] = Series(rec.unit, values)
+                else:
+                    entry.update(values)
+                    series.move_to_end(name)
+                self.measurements += 1
+
+    def __add_late (self, device, records, start):
+        keys = self.keys
+        late = self.__late
+        for rec in records:
+            if vic.TYPE_TABLE[rec.type] is None or (keys is not None and rec.key not in keys):
+                continue
+            value = rec.value
+            values = value if type(value) == tuple else (value,)
+            name = (start, (device, rec.sensor.slot, rec.sensor.sensorType, rec.key))
+            entry = late.get(name)
+            if entry is None:
+                if len(late) >= self.max_series:
+                    self.__close_late()
+                late[name] = Series(rec.unit, values)
+            else:
+                entry.update(values)
+            self.late += 1
+
+    def poll (self, now=None):
+        """
+        @brief              Closes the open window once it has ended and emits
+                            the late measurements; pass the latest event time,
+                            the clock only suits live traffic
+        """
+        with self.__lock:
+            self.__advance(self.clock() if now is None else now)
+            self.__close_late()
+
+    def flush (self):
+        """
+        @brief              Closes the open window now
+        """
+        with self.__lock:
+            self.__close()
+            self.__close_late()
+
+    def drain (self):
+        """
+        @brief              Returns and forgets the summary records emitted so far,
+                            when there is no sink
+        """
+        with self.__lock:
+            (records, self.__emitted) = (self.__emitted, list())
+        return records
+
+    def __advance (self, now):
+        start = now - now % self.window
+        if self.__start is None:
+            self.__start = start
+        elif start > self.__start:
+            self.__close()
+            self.__start = start
+
+    def __close (self):
+        while self.__series:
+            (name, entry) = self.__series.popitem(last=False)
+            self.__emit(name, entry, self.__start)
+
+    def __close_late (self):
+        for ((start, name), entry) in sorted(self.__late.items(), key=lambda item: item[0][0]):
+            self.__emit(name, entry, start, late=True)
+        self.__late.clear()
+
+    def __emit (self, name, entry, start, partial=False, late=False):
+        (device, slot, sensorType, key) = name
+        record = {
+            'deviceId'      : device,
+            'slot'          : slot,
+            'sensorType'    : sensorType,
+            'key'           : key,
+            'unit'          : list(entry.unit),
+            'windowStart'   : _timestamp(start),
+            'windowEnd'     : _timestamp(start + self.window),
+            'count'         : entry.count,
+            'min'           : entry.min,
+            'max'           : entry.max,
+            'mean'          : [total / entry.count for total in entry.sum],
+            'last'          : list(entry.last)
+        }
+        if partial:
+            record['partial'] = True
+        if late:
+            record['late'] = True
+        self.records += 1
+        doc = json.dumps(record, separators=(',', ':'))
+        if self.sink is None:
+            self.__emitted.append(doc)
+        else:
+            self.sink(doc)
+
+    def stats (self):
+        return {
+            'series'        : len(self.__series),
+            'measurements'  : self.measurements,
+            'records'       : self.records,
+            'evictions'     : self.evictions,
+            'late'          : self.late
+        }
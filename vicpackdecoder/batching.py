@@ -0,0 +1,158 @@
+'''
+    @brief  Size and time bounded batching of output records
+
+    Decoded records are gathered into JSON array messages of at most max_bytes
+    and flushed to a sink (any callable taking the message) when the next record
+    would not fit, when the oldest record has waited max_latency seconds, or
+    on demand. Without max_latency, e.g. when the batch ends with the function
+    invocation, only size and explicit flushes apply. Totals keeps the counters
+    of short-lived batchers across invocations. LocalEventHub is an in-process
+    stand-in for the output hub.
+'''
+import time
+import threading
+import collections
+
+
+# Event Hub message size limit of the basic tier, leaves room for the event envelope
+MAX_BYTES       = 250 * 1024
+MAX_LATENCY     = 1.0               # seconds
+
+FLUSH_SIZE      = 'size'            # next record did not fit
+FLUSH_LATENCY   = 'latency'         # oldest record waited max_latency
+FLUSH_OVERSIZE  = 'oversize'        # single record larger than max_bytes, sent on its own
+FLUSH_END       = 'end'             # explicit flush, e.g. end of invocation
+
+
+class Totals:
+    """
+    Flush counters summed over every batcher reporting to it,
+    safe to share between threads
+    """
+    def __init__ (self):
+        self.batches        = 0             # messages flushed
+        self.records        = 0             # records flushed
+        self.bytes          = 0             # bytes flushed
+        self.capacity       = 0             # sum of max_bytes of the flushed messages
+        self.reasons        = collections.Counter()
+        self.__lock         = threading.Lock()
+
+    def add (self, records, size, max_bytes, reason):
+        with self.__lock:
+            self.batches += 1
+            self.records += records
+            self.bytes += size
+            self.capacity += max_bytes
+            self.reasons[reason] += 1
+
+    def stats (self):
+        with self.__lock:
+            return {
+                'batches'       : self.batches,
+                'records'       : self.records,
+                'bytes'         : self.bytes,
+                'fill_ratio'    : self.bytes / self.capacity if self.capacity else 0.0,
+                'reasons'       : dict(self.reasons)
+            }
+
+
+class OutputBatcher:
+    """
+    Gathers JSON documents (str, ascii as produced by encoder.dumps) into
+    JSON array messages bounded by max_bytes and max_latency
+    """
+    def __init__ (self, sink, max_bytes=MAX_BYTES, max_latency=MAX_LATENCY, clock=time.monotonic, totals=None):
+        self.sink           = sink
+        self.max_bytes      = max_bytes
+        self.max_latency    = max_latency   # seconds, None for no time bound
+        self.clock          = clock
+        self.totals         = totals        # Totals also counting this batcher's flushes, or None
+
+        self.batches        = 0             # messages flushed
+        self.records        = 0             # records flushed
+        self.bytes          = 0             # bytes flushed
+        self.reasons        = collections.Counter()
+
+        self.__pending      = list()
+        self.__size         = 2             # enclosing brackets
+        self.__opened       = None          # time the oldest pending record was added
+
+    def __len__ (self):
+        return len(self.__pending)
+
+    def add (self, doc):
+        """
+        @brief              Adds a record, flushing the pending batch first when
+                            the record would not fit or the latency limit passed
+        """
+        size = len(doc) + (1 if self.__pending else 0)
+        if self.__pending:
+            if self.__size + size > self.max_bytes:
+                self.flush(FLUSH_SIZE)
+                size = len(doc)
+            elif self.max_latency is not None and self.clock() - self.__opened >= self.max_latency:
+                self.flush(FLUSH_LATENCY)
+                size = len(doc)
+        if 2 + size > self.max_bytes:
+            self.__emit([doc], 2 + size, FLUSH_OVERSIZE)
+            return
+        if not self.__pending:
+            self.__opened = self.clock()
+        self.__pending.append(doc)
+        self.__size += size
+
+    def poll (self):
+        """
+        @brief              Flushes the pending batch if it is older than max_latency,
+                            call periodically when records arrive slowly
+        """
+        if self.__pending and self.max_latency is not None and self.clock() - self.__opened >= self.max_latency:
+            self.flush(FLUSH_LATENCY)
+
+    def flush (self, reason=FLUSH_END):
+        """
+        @brief              Sends pending records as one message
+        """
+        if not self.__pending:
+            return
+        self.__emit(self.__pending, self.__size, reason)
+        self.__pending = list()
+        self.__size = 2
+        self.__opened = None
+
+    def __emit (self, docs, size, reason):
+        self.sink('[' + ','.join(docs) + ']')
+        self.batches += 1
+        self.records += len(docs)
+        self.bytes += size
+        self.reasons[reason] += 1
+        if self.totals is not None:
+            self.totals.add(len(docs), size, self.max_bytes, reason)
+
+    def stats (self):
+        return {
+            'batches'       : self.batches,
+            'records'       : self.records,
+            'bytes'         : self.bytes,
+            'fill_ratio'    : self.bytes / (self.batches * self.max_bytes) if self.batches else 0.0,
+            'reasons'       : dict(self.reasons)
+        }
+
+
+class LocalEventHub:
+    """
+    In-process stand-in for the output Event Hub, keeps every message
+    and rejects messages above the hub's size limit
+    """
+    def __init__ (self, max_message_bytes=256 * 1024):
+        self.max_message_bytes  = max_message_bytes
+        self.messages           = list()
+
+    def __call__ (self, message):
+        self.send(message)
+
+    def send (self, message):
+        size = len(message.encode('utf-8')) if isinstance(message, str) else len(message)
+        if size > self.max_message_bytes:
+            raise ValueError('message of {} bytes exceeds the {} byte limit'.format(size, self.max_message_bytes))
+        self.messages.append(message)
@@ -0,0 +1,170 @@
+'''
+    @brief  Bulk decoder for archived IoT Hub / Event Hub captures
+
+    Usage (from the repository root):
+        python -m vicpackdecoder.bulk capture/*.avro --output decoded.ndjson
+        python -m vicpackdecoder.bulk uplinks.ndjson --workers 8 --chunk-size 2000
+
+    Input files are Event Hub Capture Avro files (requires fastavro) or NDJSON,
+    where each line is a hex payload or a JSON object holding the payload in
+    the Body field. Payloads are decoded in chunks on a process pool and written
+    in input order as NDJSON, one {"deviceId": ..., "packet": ...} per line.
+    At most a few chunks per worker are in flight, so memory stays bounded.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import collections
+import concurrent.futures
+
+from . import validate
+from .decoder import DECODER
+
+
+def read_ndjson (path, field='Body'):
+    """
+    @brief              Reads payloads from an NDJSON file
+    @retval             Generator of (device id, payload)
+    """
+    with (sys.stdin if path == '-' else open(path)) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith('{'):
+                yield (None, line)
+                continue
+            record = json.loads(line)
+            system = record.get('SystemProperties') or dict()
+            yield (system.get('connectionDeviceId'), record[field])
+
+def read_avro (path, field='Body'):
+    """
+    @brief              Reads payloads from an Event Hub Capture Avro file
+    @retval             Generator of (device id, payload)
+    """
+    try:
+        import fastavro
+    except ImportError:
+        raise SystemExit('reading Avro captures requires fastavro, pip install fastavro')
+    with open(path, 'rb') as f:
+        for record in fastavro.reader(f):
+            system = record.get('SystemProperties') or dict()
+            yield (system.get('iothub-connection-device-id'), record[field])
+
+def read (paths, fmt='auto', field='Body'):
+    """
+    @brief              Reads payloads from all input files in order
+    """
+    for path in paths:
+        avro = fmt == 'avro' or (fmt == 'auto' and path.endswith('.avro'))
+        reader = read_avro if avro else read_ndjson
+        for item in reader(path, field):
+            yield item
+
+
+def decode_chunk (chunk, checked=False, trailer=0):
+    """
+    @brief              Decodes a chunk of payloads, runs in the worker processes
+    @param  checked     Validate frames first, see validate.check
+    @param  trailer     Bytes following the last measurement of a frame
+    @retval             (list of output lines, list of (payload, error) for failed packets)
+    """
+    lines = list()
+    errors = list()
+    for (device, payload) in chunk:
+        if checked:
+            reason = validate.check_payload(payload, trailer)[1]
+            if reason is not None:
+                errors.append((validate.payload_text(payload), reason))
+                continue
+        try:
+            doc = DECODER.dumps(payload)
+        except Exception as e:
+            errors.append((payload if isinstance(payload, str) else bytes(payload).hex(), repr(e)))
+            continue
+        lines.append('{"deviceId":' + json.dumps(device) + ',"packet":' + doc + '}')
+    return (lines, errors)
+
+def chunks (items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def decode (items, workers=None, chunk_size=1000, window=None, checked=False, trailer=0):
+    """
+    @brief              Decodes payloads on a process pool
+    @param  items       Iterable of (device id, payload)
+    @param  workers     Number of worker processes, defaults to all cores
+    @param  chunk_size  Payloads per task
+    @param  window      Maximum number of chunks in flight, defaults to 4 per worker
+    @param  checked     Validate frames first, rejected frames are reported as errors
+    @retval             Generator of decode_chunk results, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    window = window or 4 * workers
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks(items, chunk_size):
+            pending.append(pool.submit(decode_chunk, chunk, checked, trailer))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description='Decode archived vicpack uplinks')
+    parser.add_argument('inputs', nargs='+', help='Avro or NDJSON capture files, - for stdin')
+    parser.add_argument('--output', default='-', help='output NDJSON file, default stdout')
+    parser.add_argument('--errors', help='write packets that failed to decode to this NDJSON file')
+    parser.add_argument('--format', choices=('auto', 'avro', 'ndjson'), default='auto')
+    parser.add_argument('--field', default='Body', help='record field holding the payload')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default all cores')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--validate', action='store_true', help='reject malformed frames before decoding, reported as errors')
+    parser.add_argument('--trailer', type=int, default=validate.TRAILER,
+                        help='bytes following the measurements of each frame, default %(default)s')
+    parser.add_argument('--progress', type=float, default=5.0, help='seconds between progress reports, 0 disables')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    err = open(args.errors, 'w') if args.errors else None
+    decoded = failed = 0
+    start = last = time.monotonic()
+    try:
+        items = read(args.inputs, args.format, args.field)
+        for (lines, errors) in decode(items, args.workers, args.chunk_size, checked=args.validate, trailer=args.trailer):
+            for line in lines:
+                out.write(line)
+                out.write('\n')
+            if err is not None:
+                for (payload, error) in errors:
+                    err.write(json.dumps({'payload': payload, 'error': error}))
+                    err.write('\n')
+            decoded += len(lines)
+            failed += len(errors)
+            now = time.monotonic()
+            if args.progress and now - last >= args.progress:
+                last = now
+                print('{} decoded, {} failed, {:.0f} packets/s'.format(
+                    decoded, failed, (decoded + failed) / (now - start)), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if err is not None:
+            err.close()
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print('done: {} decoded, {} failed in {:.1f}s, {:.0f} packets/s'.format(
+        decoded, failed, elapsed, (decoded + failed) / elapsed), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+'''
+    @brief  Decode cache and duplicate uplink suppression
+
+    The same uplink is often delivered several times when it is received by
+    more than one LoRa gateway. DecodeCache keeps decoded output keyed by the
+    raw payload, DedupWindow drops repeats of a packet before they are decoded.
+    Both are safe to share between threads.
+'''
+import time
+import threading
+import collections
+
+
+class DecodeCache:
+    """
+    Bounded LRU cache keyed by raw payload bytes, entries expire after ttl seconds
+    """
+    def __init__ (self, size=1024, ttl=300.0, clock=time.monotonic):
+        self.size       = size          # maximum number of entries
+        self.ttl        = ttl           # entry lifetime in seconds, None for no expiry
+        self.clock      = clock
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+        self.__entries  = collections.OrderedDict()
+        self.__lock     = threading.Lock()
+
+    def __len__ (self):
+        return len(self.__entries)
+
+    def get (self, payload):
+        """
+        @brief              Returns the cached value for payload, None on a miss
+        """
+        key = bytes(payload)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                (value, expires) = entry
+                if expires is None or expires > self.clock():
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put (self, payload, value):
+        """
+        @brief              Stores value for payload, evicting the least recently
+                            used entry when the cache is full
+        """
+        key = bytes(payload)
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self.__lock:
+            self.__entries[key] = (value, expires)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats (self):
+        return {
+            'size'      : len(self.__entries),
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'evictions' : self.evictions
+        }
+
+
+class DedupWindow:
+    """
+    Remembers packet keys, e.g. (device, packetId, requestId), for window
+    seconds and reports repeats. At most size keys are kept.
+    """
+    def __init__ (self, window=30.0, size=65536, clock=time.monotonic):
+        self.window     = window        # seconds a key is remembered
+        self.size       = size          # maximum number of remembered keys
+        self.clock      = clock
+        self.hits       = 0             # duplicates dropped
+        self.misses     = 0             # first sightings
+        self.evictions  = 0
+        self.__seen     = collections.OrderedDict()
+        self.__lock     = threading.Lock()
+
+    def __len__ (self):
+        return len(self.__seen)
+
+    def seen (self, key):
+        """
+        @brief              Checks and records key
+        @retval             True when key was already seen within the window
+        """
+        now = self.clock()
+        with self.__lock:
+            # keys are kept in insertion order, expire from the oldest end
+            while self.__seen:
+                (oldest, expires) = next(iter(self.__seen.items()))
+                if expires > now:
+                    break
+                del self.__seen[oldest]
+                self.evictions += 1
+            if key in self.__seen:
+                self.hits += 1
+                return True
+            self.misses += 1
+            self.__seen[key] = now + self.window
+            if len(self.__seen) > self.size:
+                self.__seen.popitem(last=False)
+                self.evictions += 1
+            return False
+
+    def stats (self):
+        return {
+            'size'      : len(self.__seen),
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'evictions' : self.evictions
+        }
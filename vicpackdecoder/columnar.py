@@ -0,0 +1,261 @@
+'''
+    @brief  Vectorized vicpack decoder for bulk packet sets
+
+    Decodes many packets at once into flat numpy columns, one row per
+    measurement value. Intended for backfills and analytics, numpy is
+    not required by the function itself and has to be installed separately.
+'''
+import numpy as np
+
+from . import vicpack as vic
+
+
+COLUMNS = ('packet', 'measurement', 'type', 'slot', 'sensorType', 'index', 'key', 'component', 'value')
+
+UNKNOWN_KEY = 'n/a'                 # key used by vicpack.export for unknown type codes
+
+
+def _swap16 (data):
+    return ((data >> 8) & 255) | ((data & 255) << 8)
+
+def _int16 (data):
+    return (data & 0xFFFF).astype(np.uint16).view(np.int16).astype(np.int64)
+
+def _default (data):
+    return (data,)
+
+def _ondie_voltage (data):
+    return (data / 1000.0,)
+
+def _battery_voltage (data):
+    return (data / 1000000.0,)
+
+def _ondie_temperature (data):
+    return (_int16(data) / 100.0,)
+
+def _external_temperature (data):
+    return (data * 175.72 / 65536 - 46.85,)
+
+def _external_humidity (data):
+    return (data * 125 / 65536.0 - 6,)
+
+def _switch_value (data):
+    return (data >> 8, data & 255)
+
+def _acceleration (data):
+    return ((_int16(data) >> 6) * 0.0039,)
+
+def _charge (data):
+    return (data & 0xFFFF,)
+
+def _ext_current (data):
+    return (data * 0.0000322911,)
+
+def _ext_voltage (data):
+    return (data * 0.0484438,)
+
+def _ambient_light (data):
+    data = _swap16(data)
+    return (0.01 * np.ldexp(1.0, data >> 12) * (data & 4095),)
+
+def _error_code (data):
+    return ((data & 0xFFFFFFFF).astype(np.uint32).view(np.int32).astype(np.int64) * (-1),)
+
+def _sw_version (data):
+    return ((data >> 16) & 255, (data >> 8) & 255, data & 255)
+
+def _voc_iaq (data):
+    data = _swap16(data)
+    return (data & 0x3FFF, (data >> 14) & 3)
+
+def _voc_temperature (data):
+    return ((_swap16(data) & 0xFFFF) / 10.0,)
+
+def _voc_humidity (data):
+    return (_swap16(data) / 100.0,)
+
+def _voc_pressure (data):
+    return ((_swap16(data) & 0xFFFF) * 10.0,)
+
+def _tof_distance (data):
+    data = _swap16(data)
+    return (data & 0x1FFF, (data >> 13) & 7)
+
+def _terminal_voltage (data):
+    return (_swap16(data) * (3.0/(2**16)),)
+
+def _terminal_voltage_diff (data):
+    return (_swap16(data) * (3.0/(2**15)),)
+
+
+# vectorized kernels, keyed by the scalar converter they replace
+KERNELS = {
+    vic._get_default                    : _default,
+    vic._get_distance                   : _default,
+    vic._get_gpio_value                 : _default,
+    vic._get_ondie_voltage              : _ondie_voltage,
+    vic._get_battery_voltage            : _battery_voltage,
+    vic._get_ondie_temperature          : _ondie_temperature,
+    vic._get_external_temperature       : _external_temperature,
+    vic._get_external_humidity          : _external_humidity,
+    vic._get_switch_value               : _switch_value,
+    vic._get_acceleration               : _acceleration,
+    vic._get_charge                     : _charge,
+    vic._get_ext_current                : _ext_current,
+    vic._get_ext_voltage                : _ext_voltage,
+    vic._get_ambient_light              : _ambient_light,
+    vic._get_voc_ambient_light          : _ambient_light,
+    vic._get_error_code                 : _error_code,
+    vic._get_sw_version                 : _sw_version,
+    vic._get_voc_iaq                    : _voc_iaq,
+    vic._get_voc_temperature            : _voc_temperature,
+    vic._get_voc_humidity               : _voc_humidity,
+    vic._get_voc_pressure               : _voc_pressure,
+    vic._get_tof_distance               : _tof_distance,
+    vic._get_terminal_voltage           : _terminal_voltage,
+    vic._get_terminal_voltage_diff      : _terminal_voltage_diff,
+}
+
+
+def _scalar (function):
+    """
+    @brief              Wraps a scalar converter for use on arrays. The converter
+                        is called once per distinct value, which keeps results
+                        identical to vicpack for transcendental maths
+                        (e.g. the log10 in the sound level converter).
+    """
+    def kernel (data):
+        values, inverse = np.unique(data, return_inverse=True)
+        results = list()
+        for value in values.tolist():
+            res = function(value)
+            results.append(res if isinstance(res, (list, tuple)) else (res,))
+        width = len(results[0]) if results else 1
+        columns = tuple(
+            np.array([res[i] for res in results], dtype=np.float64)[inverse]
+            for i in range(width))
+        return columns
+    return kernel
+
+
+def stack (packets):
+    """
+    @brief              Stacks packets into a zero padded matrix
+    @param  packets     Iterable of payloads accepted by vicpack.add
+    @retval             (uint8 matrix of shape (packets, width), int array of packet lengths)
+    """
+    buffers = [vic.payload_buffer(packet) for packet in packets]
+    lengths = np.array([len(buf) for buf in buffers], dtype=np.intp)
+    width = int(lengths.max()) if len(buffers) else 0
+    matrix = np.zeros((len(buffers), width), dtype=np.uint8)
+    for row, buf in enumerate(buffers):
+        matrix[row, :len(buf)] = np.frombuffer(buf, dtype=np.uint8)
+    return (matrix, lengths)
+
+
+def decode (packets, lengths=None):
+    """
+    @brief              Decodes a set of packets into columns
+
+    @param  packets     Iterable of payloads, or an uint8 matrix with one
+                        (zero padded) packet per row
+    @param  lengths     Packet lengths when a matrix is given, defaults to the
+                        matrix width
+
+    @retval             dict of equal length numpy arrays, see COLUMNS. There is one
+                        row per measurement value, multi-value measurements
+                        (e.g. switch_interrupt) use one row per component.
+                        Values match vicpack.export, unknown type codes have key
+                        'n/a' and a NaN value.
+    """
+    if isinstance(packets, np.ndarray):
+        matrix = packets
+        if lengths is None:
+            lengths = np.full(matrix.shape[0], matrix.shape[1], dtype=np.intp)
+    else:
+        (matrix, lengths) = stack(packets)
+    lengths = np.asarray(lengths, dtype=np.intp)
+    (count, width) = matrix.shape
+
+    if count == 0 or width <= vic.PACKET_MEAS:
+        if count:
+            raise ValueError('packets are shorter than the vicpack header')
+        return _empty()
+
+    # like vicpack.export the first measurement is always read
+    meas = np.maximum(matrix[:, vic.PACKET_MEAS].astype(np.intp), 1)
+    short = vic.PACKET_HEADER + vic.PACKET_OFFSET * meas > lengths
+    if short.any():
+        raise ValueError('truncated packets at rows {}'.format(np.flatnonzero(short).tolist()))
+
+    # gather type codes and big-endian 32-bit values of every measurement
+    offsets = vic.PACKET_HEADER + vic.PACKET_OFFSET * np.arange(int(meas.max()))
+    valid = np.arange(len(offsets)) < meas[:, None]
+    (packet, measurement) = np.nonzero(valid)
+    pos = offsets[measurement]
+    typ = matrix[packet, pos].astype(np.intp)
+    data = np.zeros(len(pos), dtype=np.int64)
+    for i in range(1, 5):
+        data = (data << 8) | matrix[packet, pos + i]
+
+    # forward fill driver context within each packet
+    rows = np.arange(len(typ))
+    driver = typ == vic.DRIVER_TYPE
+    last = np.maximum.accumulate(np.where(driver, rows, -1))
+    context = (last >= 0) & (packet[np.maximum(last, 0)] == packet)
+    has_driver = np.bincount(packet[driver], minlength=count) > 0
+    # measurements ahead of the first driver are only exported when
+    # the packet holds no driver at all (fake default slot)
+    keep = ~driver & (context | ~has_driver[packet])
+
+    sensors = np.array(vic.SENSORS, dtype=object)
+    drv = data[np.maximum(last, 0)]
+    slot = np.where(context, (drv >> 16) & 255, vic.DEFAULT_SLOT)
+    index = np.where(context, (drv >> 8) & 255, 0)
+    sensor = np.full(len(typ), vic.DEFAULT_SENSOR_TYPE, dtype=object)
+    sensor[context] = sensors[drv[context] >> 24]
+
+    keys = np.array([entry[0] if entry else UNKNOWN_KEY for entry in vic.TYPE_TABLE], dtype=object)
+
+    # convert per type code, all rows of a type at once
+    kept = np.flatnonzero(keep)
+    parts = list()
+    for code in np.unique(typ[kept]).tolist():
+        sel = kept[typ[kept] == code]
+        entry = vic.TYPE_TABLE[code]
+        if entry is None:
+            values = (np.full(len(sel), np.nan),)
+        else:
+            function = entry[1]['function']
+            kernel = KERNELS.get(function) or _scalar(function)
+            values = kernel(data[sel])
+        for (component, value) in enumerate(values):
+            parts.append((sel, component, np.asarray(value, dtype=np.float64)))
+
+    if not parts:
+        return _empty()
+    sel = np.concatenate([part[0] for part in parts])
+    component = np.concatenate([np.full(len(part[0]), part[1], dtype=np.intp) for part in parts])
+    value = np.concatenate([part[2] for part in parts])
+    order = np.lexsort((component, sel))
+    sel = sel[order]
+
+    return {
+        'packet'        : packet[sel],
+        'measurement'   : measurement[sel],
+        'type'          : typ[sel],
+        'slot'          : slot[sel],
+        'sensorType'    : sensor[sel],
+        'index'         : index[sel],
+        'key'           : keys[typ[sel]],
+        'component'     : component[order],
+        'value'         : value[order],
+    }
+
+
+def _empty ():
+    columns = dict((name, np.zeros(0, dtype=np.intp)) for name in COLUMNS)
+    columns['sensorType'] = np.zeros(0, dtype=object)
+    columns['key'] = np.zeros(0, dtype=object)
+    columns['value'] = np.zeros(0, dtype=np.float64)
+    return columns
@@ -0,0 +1,292 @@
+'''
+    @brief  Compact binary encoding of decoded packets
+
+    A batch of decoded packets is written as one message:
+
+        magic       b'VPK'
+        version     u8, VERSION
+        types       varint count, per type code used in the batch:
+                    code u8, flags u8 (FLAG_UNKNOWN), arity u8, key string,
+                    varint unit count, unit strings
+        sensors     varint count, per sensor type used in the batch:
+                    code u8 (index in vicpack.SENSORS, SENSOR_DEFAULT
+                    without driver), name string
+        records     varint count, per packet:
+                    packetId u8, requestId u8, varint sensor count, per sensor:
+                    code u8, varint slot + 1, varint index, varint measurement
+                    count, per measurement: type code u8 and arity values
+
+    Strings are a varint byte length followed by utf-8. A value is a varint of
+    n << 2 | 0 for an integer n >= 0, of n << 2 | 1 for an integer -n - 1,
+    byte 2 followed by a big-endian float64, or byte 3 followed by a float32
+    when that represents the value exactly. Measurements of unknown type codes
+    carry no values. Keys and units are stored once per batch instead of once
+    per measurement. loads() restores the vicpack.export dictionaries exactly.
+'''
+import struct
+
+from . import vicpack as vic
+from .decoder import DECODER
+
+
+MAGIC           = b'VPK'
+VERSION         = 1
+
+FLAG_UNKNOWN    = 1                 # type code unknown to the decoder, no values
+SENSOR_DEFAULT  = 255               # sensor code of measurements without driver
+
+VALUE_INT       = 0
+VALUE_NEGATIVE  = 1
+VALUE_DOUBLE    = 2
+VALUE_FLOAT     = 3
+
+DOUBLE  = struct.Struct('>d')
+FLOAT   = struct.Struct('>f')
+
+# sensor type name -> code
+SENSOR_CODES = dict((name, code) for (code, name) in enumerate(vic.SENSORS))
+SENSOR_CODES[vic.DEFAULT_SENSOR_TYPE] = SENSOR_DEFAULT
+
+
+def _varint (out, value):
+    while value > 127:
+        out.append((value & 127) | 128)
+        value >>= 7
+    out.append(value)
+
+def _string (out, value):
+    data = value.encode('utf-8')
+    _varint(out, len(data))
+    out += data
+
+def _value (out, value):
+    if type(value) == int:
+        if value >= 0:
+            _varint(out, value << 2 | VALUE_INT)
+        else:
+            _varint(out, (-value - 1) << 2 | VALUE_NEGATIVE)
+        return
+    value = float(value)
+    packed = FLOAT.pack(value)
+    if FLOAT.unpack(packed)[0] == value:
+        out.append(VALUE_FLOAT)
+        out += packed
+    else:
+        out.append(VALUE_DOUBLE)
+        out += DOUBLE.pack(value)
+
+
+class Writer:
+    """
+    Collects decoded packets into one compact batch message
+    """
+    def __init__ (self):
+        self.types      = dict()        # type code -> arity, types used in the batch
+        self.sensors    = set()         # sensor codes used in the batch
+        self.records    = 0
+        self.__body     = bytearray()
+
+    def __len__ (self):
+        return self.records
+
+    @property
+    def nbytes (self):
+        """
+        Size of the encoded records, without the dictionary
+        """
+        return len(self.__body)
+
+    def add (self, records, packet_id, request_id):
+        """
+        @brief              Adds a packet, same content as vicpack.export
+        @param  records     Measurement records including driver entries,
+                            see vicpack.iter_packet
+        """
+        sensors = list()    # (sensor, encoded measurements, count)
+        meas = None         # measurements of the sensor being filled
+        new = False         # sensor was started by a driver entry
+        for rec in records:
+            if rec.type == vic.DRIVER_TYPE:
+                # measurements preceding the first driver entry are not exported
+                if not new:
+                    del sensors[:]
+                meas = [rec.sensor, bytearray(), 0]
+                sensors.append(meas)
+                new = True
+                continue
+            if meas is None:
+                meas = [vic.DEFAULT_SENSOR, bytearray(), 0]
+                sensors.append(meas)
+            code = rec.type
+            meas[1].append(code)
+            meas[2] += 1
+            if vic.TYPE_TABLE[code] is None:
+                self.types[code] = 0
+                continue
+            values = rec.value if type(rec.value) == tuple else (rec.value,)
+            arity = self.types.setdefault(code, len(values))
+            if arity != len(values):
+                raise ValueError('type {} returned {} values, expected {}'.format(code, len(values), arity))
+            for value in values:
+                _value(meas[1], value)
+        out = self.__body
+        out.append(packet_id)
+        out.append(request_id)
+        _varint(out, len(sensors))
+        for (sensor, data, count) in sensors:
+            code = SENSOR_CODES[sensor.sensorType]
+            self.sensors.add(code)
+            out.append(code)
+            _varint(out, sensor.slot + 1)
+            _varint(out, sensor.index)
+            _varint(out, count)
+            out += data
+        self.records += 1
+
+    def getvalue (self):
+        """
+        @brief              Returns the batch message
+        @retval             bytes
+        """
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        _varint(out, len(self.types))
+        for (code, arity) in sorted(self.types.items()):
+            entry = vic.TYPE_TABLE[code]
+            if entry is None:
+                out += bytes((code, FLAG_UNKNOWN, 0))
+                _string(out, vic.UNKNOWN_KEY)
+                _varint(out, 1)
+                _string(out, vic.UNKNOWN_UNIT)
+                continue
+            (key, spec) = entry
+            out += bytes((code, 0, arity))
+            _string(out, key)
+            _varint(out, len(spec['unit']))
+            for unit in spec['unit']:
+                _string(out, unit)
+        _varint(out, len(self.sensors))
+        for code in sorted(self.sensors):
+            out.append(code)
+            _string(out, vic.DEFAULT_SENSOR_TYPE if code == SENSOR_DEFAULT else vic.SENSORS[code])
+        _varint(out, self.records)
+        out += self.__body
+        return bytes(out)
+
+def dumps (packets, decoder=None):
+    """
+    @brief              Decodes payloads into one compact batch message
+    @param  packets     Iterable of payloads, hex text or raw binary
+    @param  decoder     Decoder to use, defaults to decoder.DECODER
+    """
+    decoder = decoder or DECODER
+    writer = Writer()
+    for payload in packets:
+        pck = decoder.buffer(payload)
+        writer.add(decoder.records(pck), pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID])
+    return writer.getvalue()
+
+
+class Reader:
+    """
+    Reads a compact batch message, see loads
+    """
+    def __init__ (self, data):
+        self.data       = memoryview(data)
+        self.offset     = 0
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError('not a compact vicpack batch')
+        self.offset = len(MAGIC)
+        self.version = self.byte()
+        if self.version != VERSION:
+            raise ValueError('unsupported compact batch version {}'.format(self.version))
+        self.types = dict()             # code -> (key, units, arity, unknown)
+        for _ in range(self.varint()):
+            code = self.byte()
+            flags = self.byte()
+            arity = self.byte()
+            key = self.string()
+            units = [self.string() for _ in range(self.varint())]
+            self.types[code] = (key, units, arity, bool(flags & FLAG_UNKNOWN))
+        self.sensors = dict()           # code -> name
+        for _ in range(self.varint()):
+            code = self.byte()
+            self.sensors[code] = self.string()
+        self.count = self.varint()
+
+    def byte (self):
+        value = self.data[self.offset]
+        self.offset += 1
+        return value
+
+    def varint (self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 127) << shift
+            if byte < 128:
+                return value
+            shift += 7
+
+    def string (self):
+        size = self.varint()
+        value = str(self.data[self.offset:self.offset + size], 'utf-8')
+        self.offset += size
+        return value
+
+    def value (self):
+        tag = self.data[self.offset]
+        if tag == VALUE_DOUBLE:
+            value = DOUBLE.unpack_from(self.data, self.offset + 1)[0]
+            self.offset += 1 + DOUBLE.size
+            return value
+        if tag == VALUE_FLOAT:
+            value = FLOAT.unpack_from(self.data, self.offset + 1)[0]
+            self.offset += 1 + FLOAT.size
+            return value
+        value = self.varint()
+        if value & 3 == VALUE_NEGATIVE:
+            return -(value >> 2) - 1
+        return value >> 2
+
+    def __iter__ (self):
+        """
+        @brief              Yields the packets as vicpack.export dictionaries
+        """
+        for _ in range(self.count):
+            export = {
+                'sensors'   : list(),
+                'time'      : dict(),
+                'packetId'  : self.byte(),
+                'requestId' : self.byte()
+            }
+            for _ in range(self.varint()):
+                name = self.sensors[self.byte()]
+                slot = self.varint() - 1
+                sensor = {
+                    'slot'          : slot,
+                    'sensorType'    : name,
+                    'index'         : self.varint(),
+                    'measurements'  : list()
+                }
+                for _ in range(self.varint()):
+                    (key, units, arity, unknown) = self.types[self.byte()]
+                    if unknown:
+                        sensor['measurements'].append({'key': key, 'value': vic.UNKNOWN_VALUE, 'unit': units[0]})
+                        continue
+                    sensor['measurements'].append({
+                        'key'   : key,
+                        'value' : [self.value() for _ in range(arity)],
+                        'unit'  : list(units)
+                    })
+                export['sensors'].append(sensor)
+            yield export
+
+def loads (data):
+    """
+    @brief              Reads a compact batch message
+    @retval             list of vicpack.export dictionaries
+    """
+    return list(Reader(data))
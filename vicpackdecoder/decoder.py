@@ -0,0 +1,101 @@
+'''
+    @brief  Stateless, reentrant packet decoder
+
+    A Decoder keeps configuration only, every packet is decoded with state local
+    to the call. One instance can therefore be shared by all threads of the
+    Functions worker thread pool, by coroutines of an async entry point and by
+    the bulk tools, without a vicpack instance per invocation. Packet shapes
+    seen repeatedly are decoded by compiled functions, see specialize.
+
+    Usage:
+        from vicpackdecoder.decoder import DECODER
+        doc = DECODER.dumps("fa0101000301100002012a000000002a00000000ced399")
+'''
+from . import vicpack as vic
+from . import encoder
+from . import specialize
+from . import metrics
+
+
+class Decoder:
+    """
+    Decodes packets given as hex text or raw binary, see vicpack.payload_buffer
+    """
+    def __init__ (self, projection=None, shapes=specialize.CACHE_SIZE):
+        """
+        @param  projection  Decode selected measurements only, None for all
+        @param  shapes      Number of compiled packet shapes to keep, 0 disables
+        """
+        self.projection = projection
+        self.shapes     = None
+        # sensor type selection depends on driver values, not on the shape
+        if shapes > 0 and (projection is None or projection.sensors is None):
+            self.shapes = specialize.ShapeCache(shapes, projection.types if projection is not None else None)
+
+    def buffer (self, payload, binary=None):
+        """
+        @brief              Returns the packet buffer of payload
+        """
+        if not metrics.enabled:
+            return vic.payload_buffer(payload, binary)
+        start = metrics.clock()
+        pck = vic.payload_buffer(payload, binary)
+        metrics.observe(metrics.STAGE_ADD, metrics.clock() - start)
+        metrics.observe_packet(len(pck), pck[vic.PACKET_MEAS])
+        return pck
+
+    def iter_measurements (self, payload, drivers=False, binary=None):
+        """
+        @brief              Walks the packet, see vicpack.iter_packet
+        @retval             Generator of Measurement records
+        """
+        return vic.iter_packet(self.buffer(payload, binary), self.projection, drivers)
+
+    def records (self, pck):
+        """
+        @brief              Walks a packet buffer, including driver entries
+        @retval             Generator of Measurement records
+        """
+        return vic.iter_packet(pck, self.projection, True)
+
+    def export (self, payload, binary=None):
+        """
+        @brief              Returns the packet as json styled dictionary,
+                            same as vicpack.export
+        """
+        pck = self.buffer(payload, binary)
+        # the generic path keeps the per stage metrics meaningful
+        if self.shapes is not None and not metrics.enabled:
+            shape = self.shapes.lookup(pck)
+            if shape is not None:
+                return shape.export(pck)
+        if metrics.enabled:
+            start = metrics.clock()
+        export = vic.build_export(vic.iter_packet(pck, self.projection, True),
+                                  pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID])
+        if metrics.enabled:
+            metrics.observe(metrics.STAGE_EXPORT, metrics.clock() - start)
+        return export
+
+    def dumps (self, payload, binary=None, as_bytes=False):
+        """
+        @brief              Returns the packet as JSON, same as encoder.dumps
+        """
+        pck = self.buffer(payload, binary)
+        if self.shapes is not None and not metrics.enabled:
+            shape = self.shapes.lookup(pck)
+            if shape is not None:
+                doc = shape.dumps(pck)
+                return doc.encode('utf-8') if as_bytes else doc
+        return encoder.encode(vic.iter_packet(pck, self.projection, True),
+                              pck[vic.PACKET_INDEX], pck[vic.PACKET_REQUESTID], as_bytes)
+
+    def stats (self):
+        """
+        @brief              Returns the counters of the compiled shape cache
+        """
+        return self.shapes.stats() if self.shapes is not None else None
+
+
+# shared instance decoding all measurements
+DECODER = Decoder()
@@ -0,0 +1,44 @@
+'''
+    @brief  Debug channel for the decoder
+
+    Diagnostics are off unless VICPACK_DEBUG_LEVEL is set (e.g. DEBUG).
+    VICPACK_DEBUG_EVERY=n only traces every n-th call to enabled().
+    Arguments wrapped in lazy() are only rendered when a record is emitted.
+'''
+import os
+import logging
+import itertools
+
+
+logger = logging.getLogger('vicpackdecoder')
+logger.setLevel((os.environ.get('VICPACK_DEBUG_LEVEL') or 'WARNING').upper())
+
+EVERY = max(int(os.environ.get('VICPACK_DEBUG_EVERY') or 1), 1)
+
+_calls = itertools.count()
+
+
+def enabled (level=logging.DEBUG):
+    """
+    @brief              Checks whether diagnostics at level should be produced
+                        for the current call, taking sampling into account
+    @retval             True or False
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    return EVERY == 1 or next(_calls) % EVERY == 0
+
+
+class lazy:
+    """
+    Log argument which is computed only when the message is formatted,
+    e.g. logger.debug('%s', lazy(str, pack))
+    """
+    __slots__ = ('function', 'args')
+
+    def __init__ (self, function, *args):
+        self.function   = function
+        self.args       = args
+
+    def __str__ (self):
+        return str(self.function(*self.args))
@@ -0,0 +1,117 @@
+'''
+    @brief  JSON serializer for the vicpack export shape
+
+    Produces the same document as json.dumps(pack.export(), separators=(',', ':'))
+    in a single pass over the packet, from pre-encoded key fragments, without
+    building the intermediate export dictionaries.
+'''
+import json
+
+from . import vicpack as vic
+from . import metrics
+
+
+def _quote (string):
+    return json.dumps(string)
+
+def _measurement_fragments (key, spec):
+    head = '{"key":' + _quote(key) + ',"value":['
+    tail = '],"unit":[' + ','.join(_quote(unit) for unit in spec['unit']) + ']}'
+    return (head, tail)
+
+# pre-encoded (head, tail) around the value of each known type code
+FRAGMENTS = [None] * 256
+for _key, _spec in vic.TYPES.items():
+    FRAGMENTS[_spec['type']] = _measurement_fragments(_key, _spec)
+del _key, _spec
+
+UNKNOWN_FRAGMENT = '{"key":' + _quote(vic.UNKNOWN_KEY) + ',"value":' + _quote(vic.UNKNOWN_VALUE) + \
+                   ',"unit":' + _quote(vic.UNKNOWN_UNIT) + '}'
+
+SENSOR_TYPES = dict((name, _quote(name)) for name in vic.SENSORS + [vic.DEFAULT_SENSOR_TYPE])
+
+PACKET_HEAD = '{"sensors":['
+PACKET_TAIL = '],"time":{},"packetId":'
+REQUEST_ID  = ',"requestId":'
+
+
+def _number (value):
+    """
+    Encodes a numeric value the way json.dumps does
+    """
+    if type(value) == int:
+        return int.__repr__(value)
+    if type(value) == float and value - value == 0.0:
+        return float.__repr__(value)
+    # bool, nan, infinity and anything else
+    return json.dumps(value)
+
+def _values (value):
+    if type(value) == tuple:
+        return ','.join([_number(v) for v in value])
+    return _number(value)
+
+def _sensor_head (sensor):
+    return '{"slot":' + _number(sensor.slot) + ',"sensorType":' + SENSOR_TYPES[sensor.sensorType] + \
+           ',"index":' + _number(sensor.index) + ',"measurements":['
+
+DEFAULT_SENSOR_HEAD = _sensor_head(vic.DEFAULT_SENSOR)
+
+
+def encode (records, packet_id, request_id, as_bytes=False):
+    """
+    @brief              Serializes measurement records of a packet to JSON, same
+                        content and key order as vicpack.export
+
+    @param  records     Measurement records including driver entries,
+                        see vicpack.iter_packet
+    @param  packet_id   Packet id from the packet header
+    @param  request_id  Request id from the packet header
+    @param  as_bytes    Return utf-8 encoded bytes instead of str, e.g. for
+                        the output binding
+
+    @retval             JSON document as str or bytes
+    """
+    if metrics.enabled:
+        start = metrics.clock()
+    out = [PACKET_HEAD]
+    head = None     # head of the sensor being filled
+    meas = None     # measurement fragments of the sensor being filled
+    new = False     # sensor was started by a driver entry
+    for rec in records:
+        if rec.type == vic.DRIVER_TYPE:
+            # measurements preceding the first driver entry are not exported
+            if new:
+                out.append(head + ','.join(meas) + ']}')
+                out.append(',')
+            head = _sensor_head(rec.sensor)
+            meas = list()
+            new = True
+        else:
+            if head is None:
+                head = DEFAULT_SENSOR_HEAD
+                meas = list()
+            fragment = FRAGMENTS[rec.type]
+            if fragment is None:
+                meas.append(UNKNOWN_FRAGMENT)
+            else:
+                meas.append(fragment[0] + _values(rec.value) + fragment[1])
+    if head is not None:
+        out.append(head + ','.join(meas) + ']}')
+    out.append(PACKET_TAIL)
+    out.append(_number(packet_id))
+    out.append(REQUEST_ID)
+    out.append(_number(request_id))
+    out.append('}')
+    doc = ''.join(out)
+    if metrics.enabled:
+        metrics.observe(metrics.STAGE_SERIALIZE, metrics.clock() - start)
+    if as_bytes:
+        return doc.encode('utf-8')
+    return doc
+
+def dumps (pack, as_bytes=False):
+    """
+    @brief              Serializes the packet of a vicpack instance to JSON, see encode
+    """
+    return encode(pack.iter_measurements(drivers=True), pack.id, pack.requestId, as_bytes)
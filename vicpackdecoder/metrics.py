@@ -0,0 +1,145 @@
+'''
+    @brief  Opt-in decode instrumentation
+
+    Records latency histograms per decode stage and per measurement type code,
+    and distributions of packet size and measurement count. Off by default,
+    instrumented code checks `enabled` once per packet or measurement, so the
+    cost when off is a single flag test. Use snapshot() or prometheus() to
+    read the collected data.
+'''
+import time
+import bisect
+
+
+enabled = False                     # collect metrics, see enable()
+clock = time.perf_counter
+
+STAGE_ADD       = 'add'             # payload parsing in vicpack.add
+STAGE_MEAS      = 'meas'            # measurement extraction from the payload
+STAGE_EXPORT    = 'export'          # building the export dictionary
+STAGE_SERIALIZE = 'serialize'       # JSON serialization
+STAGE_EVENT     = 'event'           # whole event in the function entry point
+
+LATENCY_BOUNDS  = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 1e-1, 1.0)
+SIZE_BOUNDS     = (8, 16, 32, 64, 128, 256, 512, 1024)
+COUNT_BOUNDS    = (1, 2, 4, 8, 16, 32, 64, 128, 255)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, counts[i] holds observations <= bounds[i],
+    the last count observations above every bound
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__ (self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum    = 0
+        self.count  = 0
+
+    def observe (self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot (self):
+        return {
+            'bounds'    : list(self.bounds),
+            'counts'    : list(self.counts),
+            'sum'       : self.sum,
+            'count'     : self.count
+        }
+
+
+stages  = dict()                    # stage name -> Histogram of seconds
+types   = dict()                    # type code -> Histogram of conversion seconds
+sizes   = Histogram(SIZE_BOUNDS)    # packet size in bytes
+counts  = Histogram(COUNT_BOUNDS)   # measurements per packet
+
+
+def enable (state=True):
+    global enabled
+    enabled = bool(state)
+
+def reset ():
+    global sizes, counts
+    stages.clear()
+    types.clear()
+    sizes = Histogram(SIZE_BOUNDS)
+    counts = Histogram(COUNT_BOUNDS)
+
+def observe (stage, seconds):
+    hist = stages.get(stage)
+    if hist is None:
+        hist = stages[stage] = Histogram(LATENCY_BOUNDS)
+    hist.observe(seconds)
+
+def observe_type (code, seconds):
+    hist = types.get(code)
+    if hist is None:
+        hist = types[code] = Histogram(LATENCY_BOUNDS)
+    hist.observe(seconds)
+
+def observe_packet (size, measurements):
+    sizes.observe(size)
+    counts.observe(measurements)
+
+
+def snapshot ():
+    """
+    @brief              Returns all collected metrics as plain dictionaries
+    """
+    return {
+        'stages'        : dict((name, hist.snapshot()) for (name, hist) in stages.items()),
+        'types'         : dict((code, hist.snapshot()) for (code, hist) in types.items()),
+        'packet_bytes'  : sizes.snapshot(),
+        'measurements'  : counts.snapshot()
+    }
+
+
+def _labels (labels):
+    return ','.join('{}="{}"'.format(k, v) for (k, v) in labels)
+
+def _histogram_lines (name, labels, hist):
+    lines = list()
+    total = 0
+    for (bound, count) in zip(hist.bounds + (float('inf'),), hist.counts):
+        total += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append('{}_bucket{{{}}} {}'.format(name, _labels(labels + (('le', le),)), total))
+    suffix = '{' + _labels(labels) + '}' if labels else ''
+    lines.append('{}_sum{} {}'.format(name, suffix, repr(hist.sum)))
+    lines.append('{}_count{} {}'.format(name, suffix, hist.count))
+    return lines
+
+def prometheus (names=None):
+    """
+    @brief              Returns collected metrics in Prometheus text format
+    @param  names       Optional mapping of type code to measurement key, used
+                        as key label of the conversion histograms
+    """
+    names = names or dict()
+    lines = [
+        '# HELP vicpack_stage_seconds Latency of decode stages.',
+        '# TYPE vicpack_stage_seconds histogram',
+    ]
+    for (stage, hist) in sorted(stages.items()):
+        lines += _histogram_lines('vicpack_stage_seconds', (('stage', stage),), hist)
+    lines += [
+        '# HELP vicpack_convert_seconds Latency of measurement conversion per type code.',
+        '# TYPE vicpack_convert_seconds histogram',
+    ]
+    for (code, hist) in sorted(types.items()):
+        lines += _histogram_lines('vicpack_convert_seconds', (('type', code), ('key', names.get(code, 'n/a'))), hist)
+    lines += [
+        '# HELP vicpack_packet_bytes Size of decoded packets.',
+        '# TYPE vicpack_packet_bytes histogram',
+    ]
+    lines += _histogram_lines('vicpack_packet_bytes', (), sizes)
+    lines += [
+        '# HELP vicpack_packet_measurements Measurements per decoded packet.',
+        '# TYPE vicpack_packet_measurements histogram',
+    ]
+    lines += _histogram_lines('vicpack_packet_measurements', (), counts)
+    return '\n'.join(lines) + '\n'
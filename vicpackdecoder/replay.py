@@ -0,0 +1,154 @@
+'''
+    @brief  Memory-mapped replay of raw uplink archives
+
+    Usage (from the repository root):
+        python -m vicpackdecoder.replay uplinks.bin --output decoded.ndjson
+        python -m vicpackdecoder.replay frames.bin --trailer 0
+
+    An archive is a file of back to back raw VicPack frames. The length of each
+    frame follows from its header, PACKET_HEADER bytes plus PACKET_OFFSET bytes
+    per measurement counted at PACKET_MEAS, plus a fixed trailer of
+    validate.TRAILER bytes by default. Frames are handed out as memoryview
+    slices of the mapped file, nothing is copied, so resident memory stays flat
+    regardless of the archive size.
+
+    Every frame has to start with the start of packet byte and count at least
+    one measurement, otherwise the framing is lost (e.g. a wrong --trailer) and
+    the replay stops at that offset. Frames which fail to decode are reported
+    and skipped, like the bulk decoder does.
+'''
+import os
+import sys
+import json
+import mmap
+import time
+import argparse
+
+from . import vicpack as vic
+from . import validate
+from .decoder import DECODER
+
+
+def frames (buffer, trailer=0):
+    """
+    @brief              Walks a buffer of back to back frames
+    @param  buffer      bytes, mmap or any object supporting the buffer protocol
+    @param  trailer     Number of bytes following the last measurement of each frame
+    @retval             Generator of memoryview slices, one per frame, raises
+                        ValueError where the framing is lost
+    """
+    view = memoryview(buffer)
+    size = len(view)
+    offset = 0
+    try:
+        while offset < size:
+            if offset + vic.PACKET_HEADER > size:
+                raise ValueError('truncated frame header at offset {}'.format(offset))
+            if view[offset] != validate.SOP:
+                raise ValueError('no start of packet at offset {}, check --trailer'.format(offset))
+            count = view[offset + vic.PACKET_MEAS]
+            # the decoder reads at least one measurement, the length of an empty frame is unknown
+            if count == 0:
+                raise ValueError('frame without measurements at offset {}'.format(offset))
+            length = vic.PACKET_HEADER + count * vic.PACKET_OFFSET + trailer
+            if offset + length > size:
+                raise ValueError('truncated frame at offset {}'.format(offset))
+            yield view[offset:offset + length]
+            offset += length
+    finally:
+        view.release()
+
+
+class Archive:
+    """
+    Read-only memory map of an archive file, use as context manager.
+    Frames must not be kept beyond the lifetime of the archive.
+    """
+    def __init__ (self, path, trailer=0):
+        self.path       = path
+        self.trailer    = trailer
+        self.__file     = None
+        self.__map      = None
+
+    def __enter__ (self):
+        self.__file = open(self.path, 'rb')
+        if os.fstat(self.__file.fileno()).st_size == 0:
+            # an empty file cannot be mapped, it holds no frames
+            self.__map = b''
+            return self
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.__map, 'madvise'):
+            self.__map.madvise(mmap.MADV_SEQUENTIAL)
+        return self
+
+    def __exit__ (self, *exc):
+        try:
+            if isinstance(self.__map, mmap.mmap):
+                self.__map.close()
+        except BufferError:
+            # frames still referenced, the map is closed once they are released
+            pass
+        self.__file.close()
+
+    def __len__ (self):
+        return len(self.__map)
+
+    def frames (self):
+        return frames(self.__map, self.trailer)
+
+    def decode (self):
+        """
+        @brief              Decodes every frame of the archive
+        @retval             Generator of (JSON document, None), see Decoder.dumps,
+                            or (None, (hex payload, error)) for frames which failed to decode
+        """
+        for frame in self.frames():
+            try:
+                yield (DECODER.dumps(frame, binary=True), None)
+            except Exception as e:
+                yield (None, (frame.hex(), repr(e)))
+
+
+def main (argv=None):
+    parser = argparse.ArgumentParser(description='Replay a raw vicpack uplink archive')
+    parser.add_argument('archive', help='file of back to back raw frames')
+    parser.add_argument('--output', default='-', help='output NDJSON file, default stdout')
+    parser.add_argument('--errors', help='write frames that failed to decode to this NDJSON file')
+    parser.add_argument('--trailer', type=int, default=validate.TRAILER,
+                        help='bytes following the measurements of each frame, default %(default)s')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    err = open(args.errors, 'w') if args.errors else None
+    decoded = failed = 0
+    status = 0
+    start = time.monotonic()
+    try:
+        with Archive(args.archive, args.trailer) as archive:
+            for (doc, error) in archive.decode():
+                if doc is None:
+                    failed += 1
+                    if err is not None:
+                        err.write(json.dumps({'payload': error[0], 'error': error[1]}))
+                        err.write('\n')
+                    continue
+                out.write(doc)
+                out.write('\n')
+                decoded += 1
+    except ValueError as e:
+        # framing lost, the rest of the archive cannot be split into frames
+        print('stopped: {}'.format(e), file=sys.stderr)
+        status = 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if err is not None:
+            err.close()
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print('done: {} decoded, {} failed in {:.1f}s, {:.0f} frames/s'.format(
+        decoded, failed, elapsed, (decoded + failed) / elapsed), file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
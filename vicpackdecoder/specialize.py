@@ -0,0 +1,257 @@
+'''
+    @brief  Decoders specialized to the shape of a packet
+
+    A device sends the same sequence of type codes in every uplink. The shape
+    of a packet, the bytes of its type codes, is used as signature and once a
+    signature has been seen repeatedly, straight-line export and JSON functions
+    are generated for it: the measurement values are unpacked with one struct
+    call, converters and pre-encoded fragments are bound as constants and the
+    slot layout is resolved at compile time. Only the driver entries, which
+    carry the slot context, are still decoded per packet.
+
+    Compiled shapes are kept in a bounded LRU cache. Frames which are too short
+    for their measurement count are never specialized and take the generic
+    path, which reports them as before. Output is identical to
+    vicpack.build_export and encoder.encode.
+'''
+import struct
+import threading
+import collections
+
+from . import vicpack as vic
+from . import encoder
+
+
+CACHE_SIZE  = 256       # compiled shapes kept by default
+THRESHOLD   = 2         # sightings of a signature before it is compiled
+
+
+def signature (pck):
+    """
+    @brief              Returns the type code sequence of a packet
+    @param  pck         Packet buffer, see vicpack.payload_buffer
+    @retval             bytes of the type codes, None for malformed frames
+    """
+    if len(pck) <= vic.PACKET_MEAS:
+        return None
+    end = vic.PACKET_HEADER + max(pck[vic.PACKET_MEAS], 1) * vic.PACKET_OFFSET
+    if len(pck) < end:
+        return None
+    return bytes(pck[vic.PACKET_HEADER:end:vic.PACKET_OFFSET])
+
+
+def _driver_head (data):
+    info = vic._get_driver_info(data)
+    return encoder._sensor_head(vic.Sensor(info[0], vic.SENSORS[info[1]], info[2], info[3]))
+
+def _listed (value):
+    return list(value) if type(value) == tuple else [value]
+
+def _layout (codes, wanted=None):
+    """
+    @brief              Resolves the slots of a shape like build_export does
+    @retval             list of (driver position or None, [measurement positions])
+    """
+    slots = list()
+    default = list()
+    for (pos, code) in enumerate(codes):
+        if code == vic.DRIVER_TYPE:
+            slots.append((pos, list()))
+        elif wanted is None or wanted[code]:
+            if slots:
+                slots[-1][1].append(pos)
+            else:
+                default.append(pos)
+    # measurements ahead of the first driver are only exported without drivers
+    if not slots and default:
+        slots.append((None, default))
+    return slots
+
+class _Source:
+    """
+    Accumulates the expressions of one generated function, constants
+    are bound by name in the function's namespace
+    """
+    def __init__ (self):
+        self.names = {
+            'DRIVER_INFO'   : vic._get_driver_info,
+            'DRIVER_HEAD'   : _driver_head,
+            'SENSORS'       : vic.SENSORS,
+            'VALUES'        : encoder._values,
+            'LISTED'        : _listed
+        }
+
+    def const (self, name, value):
+        self.names[name] = value
+        return name
+
+    def build (self, codes, layout, body, setup=()):
+        """
+        @brief              Compiles a function of pck returning the body expression
+        @param  setup       Statements run after the values are unpacked
+        """
+        used = sorted(set(pos for (driver, positions) in layout
+                          for pos in ([driver] if driver is not None else []) + positions))
+        lines = ['def shaped (pck):']
+        if used:
+            # skip type codes and unused measurements, unpack used values only
+            fmt = '>'
+            last = -1
+            for pos in used:
+                fmt += '{}xI'.format((pos - last - 1) * vic.PACKET_OFFSET + 1)
+                last = pos
+            unpack = self.const('UNPACK', struct.Struct(fmt).unpack_from)
+            lines.append('    ({},) = {}(pck, {})'.format(', '.join('m{}'.format(pos) for pos in used), unpack, vic.PACKET_HEADER))
+        lines += ['    ' + line for line in setup]
+        lines.append('    return ' + body)
+        code = compile('\n'.join(lines), '<vicpack shape {}>'.format(codes.hex()), 'exec')
+        namespace = dict(self.names)
+        exec(code, namespace)
+        return namespace['shaped']
+
+
+def _compile_dumps (codes, layout):
+    src = _Source()
+    parts = list()      # expressions, adjacent constant text is folded into one literal
+    text = [encoder.PACKET_HEAD]
+    def expression (expr):
+        if text:
+            parts.append(repr(''.join(text)))
+            del text[:]
+        parts.append(expr)
+    for (n, (driver, positions)) in enumerate(layout):
+        if n:
+            text.append(',')
+        if driver is None:
+            text.append(encoder.DEFAULT_SENSOR_HEAD)
+        else:
+            expression('DRIVER_HEAD(m{})'.format(driver))
+        for (i, pos) in enumerate(positions):
+            if i:
+                text.append(',')
+            fragment = encoder.FRAGMENTS[codes[pos]]
+            if fragment is None:
+                text.append(encoder.UNKNOWN_FRAGMENT)
+                continue
+            function = src.const('F{}'.format(pos), vic.TYPE_TABLE[codes[pos]][1]['function'])
+            text.append(fragment[0])
+            expression('VALUES({}(m{}))'.format(function, pos))
+            text.append(fragment[1])
+        text.append(']}')
+    text.append(encoder.PACKET_TAIL)
+    expression('str(pck[{}])'.format(vic.PACKET_INDEX))
+    text.append(encoder.REQUEST_ID)
+    expression('str(pck[{}])'.format(vic.PACKET_REQUESTID))
+    text.append('}')
+    parts.append(repr(''.join(text)))
+    return src.build(codes, layout, "''.join(({},))".format(', '.join(parts)))
+
+
+def _compile_export (codes, layout):
+    src = _Source()
+    sensors = list()
+    drivers = list()
+    for (driver, positions) in layout:
+        meas = list()
+        for pos in positions:
+            entry = vic.TYPE_TABLE[codes[pos]]
+            if entry is None:
+                meas.append('{{\'key\': {!r}, \'value\': {!r}, \'unit\': {!r}}}'.format(
+                    vic.UNKNOWN_KEY, vic.UNKNOWN_VALUE, vic.UNKNOWN_UNIT))
+                continue
+            (key, spec) = entry
+            function = src.const('F{}'.format(pos), spec['function'])
+            meas.append('{{\'key\': {!r}, \'value\': LISTED({}(m{})), \'unit\': {!r}}}'.format(
+                key, function, pos, list(spec['unit'])))
+        if driver is None:
+            head = '\'slot\': {!r}, \'sensorType\': {!r}, \'index\': {!r}'.format(
+                vic.DEFAULT_SLOT, vic.DEFAULT_SENSOR_TYPE, 0)
+        else:
+            info = 'i{}'.format(driver)
+            drivers.append('{} = DRIVER_INFO(m{})'.format(info, driver))
+            head = '\'slot\': {0}[0], \'sensorType\': SENSORS[{0}[1]], \'index\': {0}[2]'.format(info)
+        sensors.append('{{{}, \'measurements\': [{}]}}'.format(head, ', '.join(meas)))
+    body = '{{\'sensors\': [{}], \'time\': {{}}, \'packetId\': pck[{}], \'requestId\': pck[{}]}}'.format(
+        ', '.join(sensors), vic.PACKET_INDEX, vic.PACKET_REQUESTID)
+    return src.build(codes, layout, body, drivers)
+
+
+class Shape:
+    """
+    Compiled decoder of one packet shape
+    """
+    __slots__ = ('signature', 'export', 'dumps')
+
+    def __init__ (self, codes, wanted=None):
+        layout = _layout(codes, wanted)
+        self.signature  = codes
+        self.export     = _compile_export(codes, layout)     # pck -> export dictionary
+        self.dumps      = _compile_dumps(codes, layout)      # pck -> JSON str
+
+    def __repr__ (self):
+        return 'Shape({})'.format(list(self.signature))
+
+
+class ShapeCache:
+    """
+    Bounded LRU cache of compiled shapes keyed by signature. A signature is
+    compiled on its threshold-th sighting, rarer shapes take the generic path.
+    """
+    def __init__ (self, size=CACHE_SIZE, wanted=None, threshold=THRESHOLD):
+        self.size       = size          # maximum number of signatures, compiled or not
+        self.wanted     = wanted        # wanted flag per type code, see vicpack.Projection
+        self.threshold  = threshold
+        self.hits       = 0             # packets decoded by a compiled shape
+        self.misses     = 0             # packets left to the generic path
+        self.compiles   = 0
+        self.evictions  = 0
+        self.__entries  = collections.OrderedDict()     # signature -> Shape or sightings
+        self.__lock     = threading.Lock()
+
+    def __len__ (self):
+        return len(self.__entries)
+
+    def lookup (self, pck):
+        """
+        @brief              Returns the compiled shape for the packet, None
+                            when the generic path has to be used
+        """
+        key = signature(pck)
+        if key is None:
+            self.misses += 1
+            return None
+        with self.__lock:
+            entry = self.__entries.get(key, 0)
+            if type(entry) == Shape:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            entry += 1
+            if entry < self.threshold:
+                self.__entries[key] = entry
+                self.__entries.move_to_end(key)
+                self.__trim()
+                self.misses += 1
+                return None
+        shape = Shape(key, self.wanted)
+        with self.__lock:
+            self.__entries[key] = shape
+            self.__entries.move_to_end(key)
+            self.__trim()
+            self.compiles += 1
+            self.hits += 1
+        return shape
+
+    def __trim (self):
+        while len(self.__entries) > self.size:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats (self):
+        return {
+            'size'      : len(self.__entries),
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'compiles'  : self.compiles,
+            'evictions' : self.evictions
+        }
@@ -0,0 +1,171 @@
+'''
+    @brief  Frame validation ahead of decoding
+
+    check() inspects a raw frame in a single pass before any measurement is
+    converted: the header, the frame length against the measurement count,
+    the type codes and driver entries, and, when the frame has a trailer, its
+    CRC16. Malformed frames are rejected with a reason instead of failing deep
+    inside the decoder, Quarantine collects them.
+
+    Device frames end with a trailer of TRAILER bytes, one byte that is not
+    decoded followed by the CRC16 of every preceding byte of the frame, most
+    significant byte first. The CRC16 is CRC-16/ARC (polynomial 0x8005 reflected,
+    initial value 0), as checked against the sample frame
+    fa0101000301100002012a000000002a00000000ced399, whose CRC is 0xd399.
+'''
+import json
+import time
+import binascii
+import threading
+import collections
+
+from . import vicpack as vic
+from . import diagnostics
+from .diagnostics import logger, lazy
+
+
+SOP             = 0xfa              # start of packet byte
+TRAILER         = 3                 # bytes following the measurements of a device frame
+CRC_SIZE        = 2                 # CRC16 at the end of the trailer
+CRC_POLY        = 0xA001            # CRC-16/ARC polynomial 0x8005, bit reversed
+
+REASON_ENCODING = 'encoding'        # payload is not valid hex text
+REASON_HEADER   = 'header'          # frame too short for a header or wrong start of packet
+REASON_VERSION  = 'version'         # packet version not accepted
+REASON_LENGTH   = 'length'          # frame length does not match the measurement count
+REASON_TYPE     = 'type'            # unknown measurement type code
+REASON_DRIVER   = 'driver'          # driver entry with an unknown sensor type
+REASON_CRC      = 'crc'             # trailer CRC16 does not match the frame
+
+LOG_INTERVAL    = 60.0              # seconds between warnings about frames quarantined without sink
+
+# type codes known to the decoder, as deletion table for bytes.translate
+KNOWN_TYPES     = bytes(code for code in range(256) if vic.TYPE_TABLE[code] is not None)
+
+
+def _crc_table ():
+    table = list()
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC_POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC_TABLE = _crc_table()
+
+def crc16 (data, crc=0):
+    """
+    @brief              Returns the CRC-16/ARC of data
+    """
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+def check (pck, trailer=0, versions=None):
+    """
+    @brief              Validates a raw frame
+    @param  pck         Packet buffer, see vicpack.payload_buffer
+    @param  trailer     Number of bytes following the last measurement, the last
+                        CRC_SIZE of them are checked as CRC16, see TRAILER
+    @param  versions    Accepted packet versions, None accepts any
+    @retval             None for a valid frame, otherwise one of the REASON_* values
+    """
+    size = len(pck)
+    if size < vic.PACKET_HEADER or pck[0] != SOP:
+        return REASON_HEADER
+    if versions is not None and pck[1] not in versions:
+        return REASON_VERSION
+    count = pck[vic.PACKET_MEAS]
+    end = vic.PACKET_HEADER + count * vic.PACKET_OFFSET
+    # the decoder reads at least one measurement, an empty frame is invalid
+    if count == 0 or size != end + trailer:
+        return REASON_LENGTH
+    codes = bytes(pck[vic.PACKET_HEADER:end:vic.PACKET_OFFSET])
+    if codes.translate(None, KNOWN_TYPES):
+        return REASON_TYPE
+    pos = codes.find(vic.DRIVER_TYPE)
+    while pos >= 0:
+        # sensor type is the most significant byte of the driver value
+        if pck[vic.PACKET_HEADER + pos * vic.PACKET_OFFSET + 1] >= len(vic.SENSORS):
+            return REASON_DRIVER
+        pos = codes.find(vic.DRIVER_TYPE, pos + 1)
+    if trailer >= CRC_SIZE:
+        if int.from_bytes(pck[size - CRC_SIZE:size], 'big') != crc16(pck[:size - CRC_SIZE]):
+            return REASON_CRC
+    return None
+
+def check_payload (payload, trailer=0, versions=None, binary=None):
+    """
+    @brief              Validates a payload as delivered, see check
+    @retval             (packet buffer or None, reason or None)
+    """
+    try:
+        pck = vic.payload_buffer(payload, binary)
+    except (binascii.Error, ValueError):
+        return (None, REASON_ENCODING)
+    return (pck, check(pck, trailer, versions))
+
+def payload_text (payload):
+    """
+    Returns the payload as hex text, hex payloads are kept as delivered
+    """
+    if isinstance(payload, str):
+        return payload
+    payload = bytes(payload)
+    if payload and payload[0] in vic.HEX_DIGITS:
+        return payload.decode('ascii', 'replace')
+    return payload.hex()
+
+
+class Quarantine:
+    """
+    Collects rejected frames as JSON records {"deviceId", "payload", "reason"}
+    and hands them to a sink (any callable taking the record). Without a sink
+    they are only counted, see stats, and a warning is logged at most once per
+    log_interval, so a faulty device flooding the hub stays cheap; the other
+    frames go to the sampled debug channel, see diagnostics.
+    """
+    def __init__ (self, sink=None, log_interval=LOG_INTERVAL, clock=time.monotonic):
+        self.sink           = sink
+        self.log_interval   = log_interval
+        self.clock          = clock
+        self.reasons        = collections.Counter()
+        self.__logged       = None      # time of the last warning
+        self.__suppressed   = 0         # frames quarantined without warning since
+        self.__lock         = threading.Lock()
+
+    def add (self, payload, reason, device=None, sink=None):
+        """
+        @brief              Quarantines a frame
+        @param  sink        Sink for this frame, overrides the default sink
+        @retval             The record passed to the sink, None without sink
+        """
+        sink = sink or self.sink
+        now = self.clock() if sink is None else None
+        with self.__lock:
+            self.reasons[reason] += 1
+            if sink is None:
+                warn = self.__logged is None or now - self.__logged >= self.log_interval
+                if warn:
+                    (suppressed, self.__suppressed, self.__logged) = (self.__suppressed, 0, now)
+                else:
+                    self.__suppressed += 1
+        if sink is not None:
+            record = json.dumps({'deviceId': device, 'payload': payload_text(payload), 'reason': reason})
+            sink(record)
+            return record
+        if warn:
+            logger.warning('quarantined %s frame from %s: %s (%d more since the last warning)',
+                           reason, device, payload_text(payload), suppressed)
+        elif diagnostics.enabled():
+            logger.debug('quarantined %s frame from %s: %s', reason, device, lazy(payload_text, payload))
+        return None
+
+    def stats (self):
+        with self.__lock:
+            return {
+                'frames'    : sum(self.reasons.values()),
+                'reasons'   : dict(self.reasons)
+            }
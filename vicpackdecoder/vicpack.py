@@ -2,13 +2,13 @@
     @author as@virinco.com
     @brief  Vicpack parser class
 '''
-import re
 import time
-import random
+import sys
 import struct
 import math
-import ctypes
-import datetime
+import binascii
+
+from . import metrics
 
 
 
@@ -25,7 +25,679 @@ ACK_TYPE        = 126               # acknowledge type
 DEFAULT_SLOT    = -1                # default slot number when unknown or async packet is received
 DEFAULT_SENSOR_TYPE = 'UNKNOWN'     # default sensor type if unkwon or async packet is received
 
+LUT_SIZE        = 65536             # entries of a 16-bit converter lookup table
+
+MEASUREMENT = struct.Struct('>BI')  # measurement layout, type byte followed by big-endian 32-bit value
+HEX_DIGITS  = frozenset(b'0123456789abcdefABCDEF')
+
+def payload_buffer (payload, binary=None):
+    """
+    @brief              Returns packet payload as a buffer of raw bytes
+    @param  payload     Hex string, or bytes/bytearray/memoryview holding
+                        either hex text or the raw binary frame
+    @param  binary      True for raw binary, False for hex text, None to detect.
+                        A raw frame starts with the SOP byte, which is never
+                        an ascii hex digit.
+    @retval             bytes, bytearray or memoryview, raw buffers are not copied
+    """
+    if isinstance(payload, str):
+        return binascii.unhexlify(payload)
+    if isinstance(payload, memoryview) and payload.format != 'B':
+        payload = payload.cast('B')
+    if binary is None:
+        binary = len(payload) == 0 or payload[0] not in HEX_DIGITS
+    if binary:
+        return payload
+    return binascii.unhexlify(payload)
+
+class LookupTable:
+    """
+    Results of a 16-bit converter for every input, built once per process on
+    first use or by build_lookup_tables. A table holds LUT_SIZE python floats,
+    about 2 MiB, see nbytes. Disabled tables are never built and the converter
+    computes its result.
+    """
+    __slots__ = ('name', 'function', 'builder', 'enabled', 'table')
+
+    def __init__ (self, name, function, builder=None, enabled=True):
+        self.name       = name
+        self.function   = function      # converter maths for a 16-bit input
+        self.builder    = builder       # optional faster construction of the whole table
+        self.enabled    = enabled
+        self.table      = None
+
+    def build (self):
+        """
+        @brief              Returns the table, building it when needed
+        @retval             list indexed by the 16-bit input, None when disabled
+        """
+        if not self.enabled:
+            return None
+        if self.table is None:
+            if self.builder is not None:
+                self.table = self.builder()
+            else:
+                self.table = [self.function(i) for i in range(LUT_SIZE)]
+        return self.table
+
+    @property
+    def nbytes (self):
+        """
+        Approximate memory held by the table in bytes, 0 when not built
+        """
+        if self.table is None:
+            return 0
+        values = dict((id(v), v) for v in self.table)
+        return sys.getsizeof(self.table) + sum(sys.getsizeof(v) for v in values.values())
+
+def _get_sw_version (measurement):
+    """
+    @brief                  Parses application version
+
+    @param  measurement     Measurement containing encoded firmware version
+
+    @retval                 Returns tuple of numeric measurements
+    """        
+    major = ( measurement >> 16 ) & int("FF", 16)
+    minor = ( measurement >>  8 ) & int("FF", 16)
+    patch = ( measurement >>  0 ) & int("FF", 16)
+    return (major, minor, patch)
+
+def _get_driver_info (measurement):
+    """
+    @brief                  Returns driver information state
+
+    @param  measurement     Measurement containing encoded driver info
+
+    @retval                 Returns tuple of numeric measurements
+    """          
+    driver  = measurement >> 24
+    slot    = (measurement & int('0x00FF0000', 16)) >> 16
+    index   = (measurement & int('0x0000FF00', 16)) >> 8
+    enabled = (measurement & int('0x000000FF', 16))
+
+    if enabled == 0:
+        enabled = False
+    else:
+        enabled = True
+
+    return (slot, driver, index, enabled)
+
+def _get_ondie_voltage (measurement):
+    voltage = (measurement) / 1000.0
+    return voltage
+
+def _get_battery_voltage (measurement):
+    voltage = measurement / 1000000.0
+    return voltage
+
+def _int16 (measurement):
+    # two's complement of the low 16 bits
+    return ((measurement & 0xFFFF) ^ 0x8000) - 0x8000
+
+def _int32 (measurement):
+    # two's complement of the low 32 bits
+    return ((measurement & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+
+def _get_ondie_temperature (measurement):
+    num = _int16(measurement)
+    temp = num / 100.0
+    return temp
+
+def _get_distance (measurement):
+    return measurement
+
+def _calc_external_temperature (measurement):
+    temp = (measurement) * 175.72/65536 - 46.85
+    return temp
+
+def _get_external_temperature (measurement):
+    if measurement < LUT_SIZE:
+        table = TEMPERATURE_LUT.table or TEMPERATURE_LUT.build()
+        if table:
+            return table[measurement]
+    return _calc_external_temperature(measurement)
+
+def _calc_external_humidity (measurement):
+    humid = (measurement) * 125/65536.0 - 6
+    return humid
+
+def _get_external_humidity (measurement):
+    if measurement < LUT_SIZE:
+        table = HUMIDITY_LUT.table or HUMIDITY_LUT.build()
+        if table:
+            return table[measurement]
+    return _calc_external_humidity(measurement)
+
+def _get_switch_value (measurement):
+    pin   = measurement >> 8
+    value = measurement & 255
+    return (pin, value)
+
+def _get_gpio_value (measurement):
+    return measurement
+
+def _get_acceleration (measurement):
+    num = _int16(measurement)
+    acc = (num >> 6) * 0.0039
+    return acc
+
+def _get_charge (measurement):
+    num = measurement & 0xFFFF
+    return num
+
+def _get_ext_current (measurement):
+    return measurement * 0.0000322911
+
+def _get_ext_voltage (measurement):
+    return measurement * 0.0484438
+
+def _calc_ambient_light (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    exp = measurement >> 12  # get exponent
+    man = measurement & 4095 # get mantissa
+    lux = 0.01 * (2**exp) * man 
+    return lux
+
+def _get_ambient_light (measurement):
+    table = AMBIENT_LIGHT_LUT.table or AMBIENT_LIGHT_LUT.build()
+    if table:
+        return table[measurement & 0xFFFF]
+    return _calc_ambient_light(measurement)
+
+def _get_error_code (measurement):
+    error = _int32(measurement) * (-1)
+    return error
+
+def _get_default (measurement):
+    return measurement
+
+def _get_voc_iaq (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    iaq_state = ( measurement >> 14 ) & 3
+    iaq_index = ( measurement & int('0x3FFF',16) )        
+    return (iaq_index, iaq_state)
+
+def _get_voc_temperature (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)        
+    temp = measurement & int ('0xFFFF', 16)
+    temp = temp / 10.0
+    return temp
+
+def _get_voc_humidity (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    humidity = measurement & int ('0xFFFF', 16)
+    humidity = measurement / 100.0        
+    return humidity
+
+def _get_voc_pressure (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    pressure = measurement & int ('0xFFFF', 16)
+    pressure = pressure * 10.0           
+    return pressure
+
+def _get_voc_ambient_light (measurement):
+    # same encoding as the ambient light sensor
+    table = AMBIENT_LIGHT_LUT.table or AMBIENT_LIGHT_LUT.build()
+    if table:
+        return table[measurement & 0xFFFF]
+    return _calc_ambient_light(measurement)
+
+def _calc_voc_sound_level (measurement):    
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    rf    = 82000.0
+    rs    = 1000.0
+    vref  = 11.23 # mV/pa (peak)
+    vmic  = -((2 ** (-1 - 16) * rs * 3.0 * (2 ** 16 - 2 * measurement )) / rf)
+    try:
+    	dbspl = 20 * math.log10 ( vmic / vref) + (-42) + 94
+    except:
+    	dbspl = 0
+    return dbspl
+
+def _get_voc_sound_level (measurement):
+    table = SOUND_LEVEL_LUT.table or SOUND_LEVEL_LUT.build()
+    if table:
+        return table[measurement & 0xFFFF]
+    return _calc_voc_sound_level(measurement)
+
+def _get_tof_distance (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    tof_state = (measurement >> 13 ) & 7
+    tof_distance = ( measurement & int('0x1FFF',16) )        
+    return (tof_distance, tof_state)
+
+def _get_terminal_voltage (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    return measurement * (3.0/(2**16))
+
+def _get_terminal_voltage_diff (measurement):
+    measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
+    return measurement * (3.0/(2**15))
+
+def _byte_swapped (table):
+    """
+    Reorders a table indexed by the byte swapped input to be indexed by the
+    input: the 256x256 table is transposed
+    """
+    result = list()
+    for low in range(256):
+        result += table[low::256]
+    return result
+
+# whole table builders, same maths and operation order as the _calc_ functions,
+# without a function call per entry
+def _build_ambient_light ():
+    table = list()
+    for exp in range(16):
+        scale = 0.01 * (2**exp)
+        table += [scale * man for man in range(4096)]
+    return _byte_swapped(table)
+
+def _build_voc_sound_level ():
+    rf    = 82000.0
+    rs    = 1000.0
+    vref  = 11.23
+    log10 = math.log10
+    # vmic is not positive up to half scale, the logarithm fails and the level is 0
+    table = [0] * (LUT_SIZE // 2 + 1)
+    table += [20 * log10(-((2 ** (-1 - 16) * rs * 3.0 * (2 ** 16 - 2 * measurement)) / rf) / vref) + (-42) + 94
+              for measurement in range(LUT_SIZE // 2 + 1, LUT_SIZE)]
+    return _byte_swapped(table)
+
+def _build_external_temperature ():
+    return [measurement * 175.72/65536 - 46.85 for measurement in range(LUT_SIZE)]
+
+def _build_external_humidity ():
+    return [measurement * 125/65536.0 - 6 for measurement in range(LUT_SIZE)]
+
+# lookup tables of the 16-bit converters, see enable_lookup_tables
+AMBIENT_LIGHT_LUT   = LookupTable('ambient_light', _calc_ambient_light, _build_ambient_light)
+SOUND_LEVEL_LUT     = LookupTable('sound_level', _calc_voc_sound_level, _build_voc_sound_level)
+TEMPERATURE_LUT     = LookupTable('temperature', _calc_external_temperature, _build_external_temperature)
+HUMIDITY_LUT        = LookupTable('humidity', _calc_external_humidity, _build_external_humidity)
+
+LOOKUP_TABLES = dict((lut.name, lut) for lut in (AMBIENT_LIGHT_LUT, SOUND_LEVEL_LUT, TEMPERATURE_LUT, HUMIDITY_LUT))
+# tables worth building ahead of the first packet, the temperature and humidity
+# converters are cheap enough that their tables save little per call
+PRELOAD_TABLES = ('ambient_light', 'sound_level')
+
+def _lookup_table_names (names):
+    if names == 'all':
+        return set(LOOKUP_TABLES)
+    if names == 'none':
+        return set()
+    names = set(names)
+    unknown = names - set(LOOKUP_TABLES)
+    if unknown:
+        raise ValueError('unknown lookup tables: {}'.format(', '.join(sorted(unknown))))
+    return names
+
+def enable_lookup_tables (names):
+    """
+    @brief              Selects the lookup tables to use, others are disabled
+                        and their memory released
+    @param  names       Iterable of LOOKUP_TABLES names, or 'all' / 'none'
+    """
+    names = _lookup_table_names(names)
+    for (name, lut) in LOOKUP_TABLES.items():
+        lut.enabled = name in names
+        if not lut.enabled:
+            lut.table = None
+
+def build_lookup_tables (names='all'):
+    """
+    @brief              Builds enabled lookup tables now instead of on first use
+    @param  names       Iterable of LOOKUP_TABLES names, or 'all' / 'none'
+    """
+    for name in _lookup_table_names(names):
+        LOOKUP_TABLES[name].build()
+
+TYPES = {
+    'no_measurement'            :{'fmt': 'unknown       : {:d}'                             , 'type': 0  , 'si': False, 'units': ''                 , 'function': _get_default},   
+    'driver_info'               :{'fmt': 'slot: {:02d}, drv: {:02d}, index: {:02d}, ena: {}', 'type': 1  , 'si': False, 'units': ''                 , 'function': _get_driver_info},
+    'sampling_time'             :{'fmt': '{}'                                               , 'type': 2  , 'si': False, 'units': 'sec'              , 'function': _get_default},
+    'sampling_time_lsb'         :{'fmt': '{}'                                               , 'type': 3  , 'si': False, 'units': ''                 , 'function': _get_default},
+    'sampling_time_offset'      :{'fmt': '{}'                                               , 'type': 4  , 'si': False, 'units': 'usec'             , 'function': _get_default},
+
+    'internal_battery_on_die'   :{'fmt': 'on-die volt   : {:.2f}'                           , 'type': 7  , 'si': True,  'units': 'V'                , 'function': _get_ondie_voltage}, 
+    'internal_battery'          :{'fmt': 'battery       : {:.2f}'                           , 'type': 8  , 'si': True,  'units': 'V'                , 'function': _get_battery_voltage},
+    'internal_temperature'      :{'fmt': 'on-die temp   : {:.2f}'                           , 'type': 11 , 'si': True,  'units': 'C'                , 'function': _get_ondie_temperature},
+    'voltage_real_part'         :{'fmt': 'ext. voltage  : {:.2f}'                           , 'type': 13 , 'si': True,  'units': 'V'                , 'function': _get_ext_voltage},
+    'voltage_imag_part'         :{'fmt': '{}'                                               , 'type': 14 , 'si': True,  'units': 'V'                , 'function': _get_default},
+    'current_real_part'         :{'fmt': 'ext. current  : {:.2f}'                           , 'type': 15 , 'si': True,  'units': 'A'                , 'function': _get_ext_current},
+    'current_imag_part'         :{'fmt': '{}'                                               , 'type': 16 , 'si': True,  'units': 'A'                , 'function': _get_default},
+
+    'charge'                    :{'fmt': '{}'                                               , 'type': 19 , 'si': True,  'units': 'C'                , 'function': _get_charge},
+    'temperature'               :{'fmt': 'temperature   : {:.2f}'                           , 'type': 20 , 'si': False, 'units': 'C'                , 'function': _get_external_temperature},
+    'humidity'                  :{'fmt': 'humidity      : {:.2f}'                           , 'type': 21 , 'si': False, 'units': 'RH'               , 'function': _get_external_humidity},
+    'pressure'                  :{'fmt': '{}'                                               , 'type': 22 , 'si': False, 'units': 'bar'              , 'function': _get_default},
+    'acceleration_x'            :{'fmt': 'acc. x-axis   : {:.2f}'                           , 'type': 23 , 'si': True,  'units': 'g'                , 'function': _get_acceleration},
+    'acceleration_y'            :{'fmt': 'acc. y-axis   : {:.2f}'                           , 'type': 24 , 'si': True,  'units': 'g'                , 'function': _get_acceleration},
+    'acceleration_z'            :{'fmt': 'acc. z-axis   : {:.2f}'                           , 'type': 25 , 'si': True,  'units': 'g'                , 'function': _get_acceleration},
+    'switch_interrupt'          :{'fmt': 'switch        : {}, {}'                           , 'type': 26 , 'si': False, 'units': ['pin','value']    , 'function': _get_switch_value},
+    'audio_average'             :{'fmt': 'audio avg     : {:.2f}'                           , 'type': 27 , 'si': False, 'units': 'count'            , 'function': _get_default},
+    'audio_max'                 :{'fmt': 'audio max     : {:.2f}'                           , 'type': 28 , 'si': False, 'units': 'count'            , 'function': _get_default},
+    'audio_spl'                 :{'fmt': 'audio spl     : {:.2f}'                           , 'type': 29 , 'si': False, 'units': 'dB'               , 'function': _get_default},
+    'ambient_light_visible'     :{'fmt': 'ambient light : {:2f}'                            , 'type': 30 , 'si': False, 'units': 'lux'              , 'function': _get_ambient_light},
+    'ambient_light_ir'          :{'fmt': 'ambient ir    : {:2f}'                            , 'type': 31 , 'si': False, 'units': 'lux'              , 'function': _get_default},
+    'ambient_light_uv'          :{'fmt': 'uv index      : {:d}'                             , 'type': 32 , 'si': False, 'units': ''                 , 'function': _get_default},
+    'co2_level'                 :{'fmt': 'co2 level     : {:d}'                             , 'type': 33 , 'si': False, 'units': 'g'                , 'function': _get_default},
+    'distance'                  :{'fmt': 'distance      : {:d}'                             , 'type': 34 , 'si': False, 'units': 'mm'               , 'function': _get_distance},
+    'sample_rate'               :{'fmt': 'sample rate   : {:2d}'                            , 'type': 35 , 'si': False, 'units': 'msec'             , 'function': _get_default},
+
+    'magnetometer'              :{'fmt': 'magnetometer  : {:2d}'                            , 'type': 40 , 'si': False, 'units': ''                 , 'function': _get_default},
+    'fft_data'                  :{'fmt': 'fft_data      : {:2d}'                            , 'type': 41 , 'si': False, 'units': ''                 , 'function': _get_default},
+    'gpio_value'                :{'fmt': 'gpio value    : {:2d}'                            , 'type': 42 , 'si': False, 'units': ''                 , 'function': _get_gpio_value},
+    'voc_iaq'                   :{'fmt': 'iaq           : {:2d}, {:d}'                      , 'type': 43 , 'si': False, 'units': ['index', 'state'] , 'function': _get_voc_iaq},
+    'voc_temperature'           :{'fmt': 'temperature   : {:2f}'                            , 'type': 44 , 'si': False, 'units': 'C'                , 'function': _get_voc_temperature},
+    'voc_humidity'              :{'fmt': 'humidity      : {:2f}'                            , 'type': 45 , 'si': False, 'units': 'RH%'              , 'function': _get_voc_humidity},                                        
+    'voc_pressure'              :{'fmt': 'pressure      : {:2f}'                            , 'type': 46 , 'si': False, 'units': 'pA'               , 'function': _get_voc_pressure},
+    'voc_ambient_light'         :{'fmt': 'ambient light : {:2f}'                            , 'type': 47 , 'si': False, 'units': 'lux'              , 'function': _get_voc_ambient_light},
+    'voc_sound_level'           :{'fmt': 'sound level   : {:2f}'                            , 'type': 48 , 'si': False, 'units': 'dbSpl'            , 'function': _get_voc_sound_level},
+    'tof_distance'              :{'fmt': 'distance      : {:2d}, {:d}'                      , 'type': 49 , 'si': False, 'units': ['mm', 'state']    , 'function': _get_tof_distance},   
+    'accelerometer_status'      :{'fmt': 'acc. status   : {:2d}'                            , 'type': 50 , 'si': False, 'units': 'state'            , 'function': _get_default},                    
+    'gps'                       :{'fmt': 'gps           : {:2d}'                            , 'type': 51 , 'si': False, 'units': 'state'            , 'function': _get_default},                    
+    'voltage'                   :{'fmt': 'voltage       : {:.2f}'                           , 'type': 52 , 'si': False, 'units': 'V'                , 'function': _get_terminal_voltage},
+    'voltage_diff'              :{'fmt': 'voltage diff  : {:.2f}'                           , 'type': 53 , 'si': False, 'units': 'V'                , 'function': _get_terminal_voltage_diff},
+    'voltage_ref'               :{'fmt': 'voltage vref  : {:.2f}'                           , 'type': 54 , 'si': False, 'units': 'V'                , 'function': _get_terminal_voltage},
+
+    'advertisement'             :{'fmt': 'advertisement : {:d}'                             , 'type': 100, 'si': False, 'units': ''                 , 'function': _get_default},
+
+    'stream_start'              :{'fmt': 'stream start  : {:d}'                             , 'type': 121, 'si': False, 'units': ''                 , 'function': _get_default},
+    'stream_stop'               :{'fmt': 'stream stop   : {:d}'                             , 'type': 122, 'si': False, 'units': ''                 , 'function': _get_default},
+
+    'value_raw'                 :{'fmt': 'raw value     : {:d}'                             , 'type': 123, 'si': False, 'units': ''                 , 'function': _get_default},
+    'app_sw_ver'                :{'fmt': 'sw ver        : {:d}.{:d}.{:d}'                   , 'type': 124, 'si': False, 'units': ''                 , 'function': _get_sw_version},
+    'driver_resp'               :{'fmt': 'drv response  : {:d}'                             , 'type': 125, 'si': False, 'units': ''                 , 'function': _get_default},
+    'packet_ack'                :{'fmt': 'ack packet id : {:d}'                             , 'type': 126, 'si': False, 'units': ''                 , 'function': _get_default},
+    'error_code'                :{'fmt': 'error code    : {:d}'                             , 'type': 127, 'si': False, 'units': ''                 , 'function': _get_error_code},
+    'crc_code'                  :{'fmt': 'crc 16        : 0x{:x}'                           , 'type': 128, 'si': False, 'units': ''                 , 'function': _get_default},
+    'shutdown'                  :{'fmt': 'shutdown      : {:d}'                             , 'type': 129, 'si': False, 'units': ''                 , 'function': _get_default},
+    'variable_length'           :{'fmt': 'varlen        : {:d}'                             , 'type': 130, 'si': False, 'units': ''                 , 'function': _get_default},
+    'device_id'                 :{'fmt': 'device id     : {:d}'                             , 'type': 131, 'si': False, 'units': ''                 , 'function': _get_default},
+    'device_pin'                :{'fmt': 'device pin    : {:d}'                             , 'type': 132, 'si': False, 'units': ''                 , 'function': _get_default},
+    'rssi_level'                :{'fmt': 'rssi level    : {:d}'                             , 'type': 133, 'si': False, 'units': ''                 , 'function': _get_default},
+    'cell_id'                   :{'fmt': 'cell id       : {:d}'                             , 'type': 134, 'si': False, 'units': ''                 , 'function': _get_default},
+    'config_ver'                :{'fmt': 'config ver    : {:d}'                             , 'type': 135, 'si': False, 'units': ''                 , 'function': _get_default}
+}
+
+
+SENSORS = [
+    'SENSOR_NO_SENSOR',             #0
+    'SENSOR_SI7050_TEMP',           #1
+    'SENSOR_SI7020_HUMIDITY',       #2
+    'SENSOR_SWITCH',                #3
+    'SENSOR_INTERNAL_ADC',          #4
+    'SENSOR_LTC1864L_ADC',          #5
+    'SENSOR_420MA_LOOP',            #6
+    'SENSOR_UART',                  #7
+    'SENSOR_ACCELEROMETER',         #8
+    'SENSOR_DIGITAL_MIC',           #9
+    'SENSOR_AMBIENT_LIGHT',         #10
+    'SENSOR_CO2_MODULE',            #11
+    'SENSOR_CUSTOM_1',              #12
+    'SENSOR_CUSTOM_2',              #13
+    'SENSOR_CUSTOM_3',              #14
+    'SENSOR_CUSTOM_4',              #15
+    'SENSOR_DEBUG',                 #16
+    'SENSOR_ENVIRONMENTAL',         #17
+    'SENSOR_GPS',                   #18
+    'SENSOR_TERMINAL',              #19
+    'SENSOR_TOF',                   #20
+    'SENSOR_PIR',                   #21
+    'SENSOR_CAPA',                  #22
+    'SENSOR_SONAR'                  #23
+]
+
+
+ERRORS = [
+    'No Error',
+    'Generic Error',
+    'No Resources',
+    'Invalid value',
+    'Timeout',
+    'Object not found',
+    'Invalid state',
+    'Hardware error',
+    'Device busy',
+    'Corrupted resource',
+    'Resource in use',
+    'Comparison error',
+    'Readonly resource',
+    'Flash erase',
+    'Read error',
+    'Write error',
+    'Resource already exists',
+    'Not supported',
+    'Invalid size',
+    'Invalid type',
+    'Unknown parameter',
+    'Access denied',
+    'Low voltage',
+]
+
+# measurement type lookup indexed by numeric type code, built once per module.
+# 'unit' holds the units as a tuple shared by all measurements of the type
+TYPE_TABLE = [None] * 256
+for _key, _spec in TYPES.items():
+    _spec['unit'] = tuple(_spec['units']) if type(_spec['units']) == type(list()) else (_spec['units'],)
+    TYPE_TABLE[_spec['type']] = (_key, _spec)
+del _key, _spec
+
+UNKNOWN_KEY     = 'n/a'             # key of measurements with an unknown type code
+UNKNOWN_VALUE   = '0'               # value of measurements with an unknown type code
+UNKNOWN_UNIT    = 'n/a'             # unit of measurements with an unknown type code
+
+class Sensor:
+    """
+    Driver context of a slot, shared by all measurements of the slot
+    """
+    __slots__ = ('slot', 'sensorType', 'index', 'enabled')
+
+    def __init__ (self, slot, sensorType, index, enabled):
+        self.slot       = slot
+        self.sensorType = sensorType
+        self.index      = index
+        self.enabled    = enabled
+
+    def __repr__ (self):
+        return 'Sensor(slot={}, sensorType={}, index={}, enabled={})'.format(
+            self.slot, self.sensorType, self.index, self.enabled)
+
+# context of measurements which are not preceded by a driver entry
+DEFAULT_SENSOR = Sensor(DEFAULT_SLOT, DEFAULT_SENSOR_TYPE, 0, False)
+
+class Measurement:
+    """
+    Single decoded measurement. The value is a scalar, or a tuple for
+    types with multiple values, the unit is the shared tuple from TYPE_TABLE.
+    """
+    __slots__ = ('type', 'key', 'value', 'unit', 'sensor')
+
+    def __init__ (self, typ, key, value, unit, sensor):
+        self.type       = typ
+        self.key        = key
+        self.value      = value
+        self.unit       = unit
+        self.sensor     = sensor
+
+    def __repr__ (self):
+        return 'Measurement(type={}, key={}, value={}, unit={}, sensor={})'.format(
+            self.type, self.key, self.value, self.unit, self.sensor)
+
+    @property
+    def slot (self):
+        return self.sensor.slot
+
+    @property
+    def sensorType (self):
+        return self.sensor.sensorType
+
+    @property
+    def index (self):
+        return self.sensor.index
+
+    def as_dict (self):
+        """
+        Returns json styled dictionary of the measurement, as used by
+        vicpack.export, with value and unit as lists
+        """
+        if TYPE_TABLE[self.type] is None:
+            return {'key': self.key, 'value': self.value, 'unit': self.unit}
+        value = self.value
+        return {
+            'key'   : self.key,
+            'value' : list(value) if type(value) == tuple else [value],
+            'unit'  : list(self.unit)
+        }
+
+class Projection:
+    """
+    Selection of the measurements to decode. Type codes and measurement keys
+    add up to the set of wanted types, all types are wanted when neither is
+    given. Sensors limits decoding to slots of the given sensor types
+    (names from SENSORS, or DEFAULT_SENSOR_TYPE for measurements without driver).
+    """
+    __slots__ = ('types', 'sensors')
+
+    def __init__ (self, types=None, keys=None, sensors=None):
+        if types is None and keys is None:
+            wanted = None
+        else:
+            wanted = set(int(code) for code in (types or ()))
+            for key in (keys or ()):
+                if key not in TYPES:
+                    raise ValueError('unknown measurement key: {}'.format(key))
+                wanted.add(TYPES[key]['type'])
+        if sensors is not None:
+            sensors = frozenset(sensors)
+            unknown = sensors - set(SENSORS) - set([DEFAULT_SENSOR_TYPE])
+            if unknown:
+                raise ValueError('unknown sensor types: {}'.format(', '.join(sorted(unknown))))
+        # wanted flag per type code, indexed like TYPE_TABLE
+        self.types      = [wanted is None or code in wanted for code in range(256)]
+        self.sensors    = sensors
+
+    def __repr__ (self):
+        return 'Projection(types={}, sensors={})'.format(
+            [code for code in range(256) if self.types[code]], sorted(self.sensors) if self.sensors is not None else None)
+
+def iter_packet (pck, projection=None, drivers=False):
+    """
+    @brief              Walks a packet and yields one Measurement per measurement,
+                        in packet order. All state is local to the call, so this
+                        is safe to use from several threads at once.
+    @param  pck         Packet buffer, see payload_buffer
+    @param  projection  Optional Projection, only selected measurements, and driver
+                        entries of selected sensors, are yielded
+    @param  drivers     Also yield the driver_info entries which start a
+                        new slot, these carry the new slot context
+    @retval             Generator of Measurement records. Measurements ahead of
+                        the first driver_info carry the default slot context.
+                        With a sensors projection they are only yielded when the
+                        packet has no driver_info at all, as build_export drops
+                        them otherwise, also when the driver's slot is skipped.
+    """
+    sensor  = DEFAULT_SENSOR
+    driver  = TYPES['driver_info']['unit']
+    timed   = metrics.enabled
+    wanted  = None      # wanted flag per type code
+    sensors = None      # wanted sensor types
+    skip    = False     # skip the current slot
+    if projection is not None:
+        wanted  = projection.types
+        sensors = projection.sensors
+        skip    = sensors is not None and sensor.sensorType not in sensors
+        if sensors is not None and not skip:
+            # the packet has a driver entry, possibly in a skipped slot, look by type byte
+            skip = any(pck[PACKET_OFFSET * num + PACKET_HEADER] == DRIVER_TYPE for num in range(pck[PACKET_MEAS]))
+    for num in range(max(pck[PACKET_MEAS], 1)):
+        if wanted is not None:
+            # skip unwanted measurements by their type byte only
+            typ = pck[PACKET_OFFSET * num + PACKET_HEADER]
+            if typ != DRIVER_TYPE and (skip or not wanted[typ]):
+                continue
+        if timed:
+            start = metrics.clock()
+            (typ, data) = MEASUREMENT.unpack_from(pck, PACKET_OFFSET * num + PACKET_HEADER)
+            metrics.observe(metrics.STAGE_MEAS, metrics.clock() - start)
+        else:
+            (typ, data) = MEASUREMENT.unpack_from(pck, PACKET_OFFSET * num + PACKET_HEADER)
+        if typ == DRIVER_TYPE:
+            value = _get_driver_info(data)
+            sensor  = Sensor(value[0], SENSORS[value[1]], value[2], value[3])
+            if sensors is not None:
+                skip = sensor.sensorType not in sensors
+                if skip:
+                    continue
+            if drivers:
+                yield Measurement(typ, 'driver_info', value, driver, sensor)
+            continue
+        entry = TYPE_TABLE[typ]
+        if entry is None:
+            yield Measurement(typ, UNKNOWN_KEY, UNKNOWN_VALUE, UNKNOWN_UNIT, sensor)
+            continue
+        (k, v) = entry
+        if timed:
+            start = metrics.clock()
+            value = v['function'](data)
+            metrics.observe_type(typ, metrics.clock() - start)
+        else:
+            value = v['function'](data)
+        yield Measurement(typ, k, value, v['unit'], sensor)
+
+def build_export (records, packet_id, request_id):
+    """
+    @brief              Builds the json styled export dictionary
+    @param  records     Measurement records including driver entries,
+                        see iter_packet
+    @retval             dict with sensors, time, packetId and requestId
+    """
+    export = {
+        'sensors'   : list(),
+        'time'      : dict(),
+        'packetId'  : packet_id,
+        'requestId' : request_id
+    }
+
+    val = None   # sensor being filled
+    new = False  # sensor was started by a driver entry
+    for rec in records:
+        if rec.type == DRIVER_TYPE:
+            # append slot to export previous result, measurements
+            # preceding the first driver entry are not exported
+            if new:
+                export['sensors'].append (val)
+            # start new slot
+            val = {
+                'slot'          : rec.sensor.slot,
+                'sensorType'    : rec.sensor.sensorType,
+                'index'         : rec.sensor.index,
+                'measurements'  : list()
+            }
+            new = True
+        else:
+            if val is None:
+                # create fake slot
+                val = {
+                    'slot'          : DEFAULT_SLOT,
+                    'sensorType'    : DEFAULT_SENSOR_TYPE,
+                    'index'         : 0,
+                    'measurements'  : list()
+                }
+            val['measurements'].append(rec.as_dict())
+    # append last result, there is none when a projection skipped everything
+    if val is not None:
+        export['sensors'].append(val)
+    return export
+
 class vicpack:
+    # measurement registry shared by all instances, see module level tables
+    types   = TYPES
+    sensors = SENSORS
+    errors  = ERRORS
+
     def __init__ (self):
         # configuration settings
         self.detail     = False         # detailed printout on call to print
@@ -38,133 +710,13 @@ class vicpack:
         self.requestId  = 0             # request id
         self.meas       = 0             # total number of measurements in packet
         self.size       = 0             # size in bytes
-        self.pck        = list()        # packet payload
+        self.pck        = bytes()       # packet payload
         self.slot       = 0             # current slot where driver is located
         self.driver     = 0             # current driver type, see self.sensors for types
         self.index      = 0             # index to driver location in the node storage table
         self.enabled    = False         # driver state, enabled or disabled
-
-        self.types = {
-                    'no_measurement'            :{'fmt': 'unknown       : {:d}'                             , 'type': 0  , 'si': False, 'units': ''                 , 'function': self.__get_default},   
-                    'driver_info'               :{'fmt': 'slot: {:02d}, drv: {:02d}, index: {:02d}, ena: {}', 'type': 1  , 'si': False, 'units': ''                 , 'function': self.__get_driver_info},
-                    'sampling_time'             :{'fmt': '{}'                                               , 'type': 2  , 'si': False, 'units': 'sec'              , 'function': self.__get_default},
-                    'sampling_time_lsb'         :{'fmt': '{}'                                               , 'type': 3  , 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'sampling_time_offset'      :{'fmt': '{}'                                               , 'type': 4  , 'si': False, 'units': 'usec'             , 'function': self.__get_default},
-     
-                    'internal_battery_on_die'   :{'fmt': 'on-die volt   : {:.2f}'                           , 'type': 7  , 'si': True,  'units': 'V'                , 'function': self.__get_ondie_voltage}, 
-                    'internal_battery'          :{'fmt': 'battery       : {:.2f}'                           , 'type': 8  , 'si': True,  'units': 'V'                , 'function': self.__get_battery_voltage},
-                    'internal_temperature'      :{'fmt': 'on-die temp   : {:.2f}'                           , 'type': 11 , 'si': True,  'units': 'C'                , 'function': self.__get_ondie_temperature},
-                    'voltage_real_part'         :{'fmt': 'ext. voltage  : {:.2f}'                           , 'type': 13 , 'si': True,  'units': 'V'                , 'function': self.__get_ext_voltage},
-                    'voltage_imag_part'         :{'fmt': '{}'                                               , 'type': 14 , 'si': True,  'units': 'V'                , 'function': self.__get_default},
-                    'current_real_part'         :{'fmt': 'ext. current  : {:.2f}'                           , 'type': 15 , 'si': True,  'units': 'A'                , 'function': self.__get_ext_current},
-                    'current_imag_part'         :{'fmt': '{}'                                               , 'type': 16 , 'si': True,  'units': 'A'                , 'function': self.__get_default},
-
-                    'charge'                    :{'fmt': '{}'                                               , 'type': 19 , 'si': True,  'units': 'C'                , 'function': self.__get_charge},
-                    'temperature'               :{'fmt': 'temperature   : {:.2f}'                           , 'type': 20 , 'si': False, 'units': 'C'                , 'function': self.__get_external_temperature},
-                    'humidity'                  :{'fmt': 'humidity      : {:.2f}'                           , 'type': 21 , 'si': False, 'units': 'RH'               , 'function': self.__get_external_humidity},
-                    'pressure'                  :{'fmt': '{}'                                               , 'type': 22 , 'si': False, 'units': 'bar'              , 'function': self.__get_default},
-                    'acceleration_x'            :{'fmt': 'acc. x-axis   : {:.2f}'                           , 'type': 23 , 'si': True,  'units': 'g'                , 'function': self.__get_acceleration},
-                    'acceleration_y'            :{'fmt': 'acc. y-axis   : {:.2f}'                           , 'type': 24 , 'si': True,  'units': 'g'                , 'function': self.__get_acceleration},
-                    'acceleration_z'            :{'fmt': 'acc. z-axis   : {:.2f}'                           , 'type': 25 , 'si': True,  'units': 'g'                , 'function': self.__get_acceleration},
-                    'switch_interrupt'          :{'fmt': 'switch        : {}, {}'                           , 'type': 26 , 'si': False, 'units': ['pin','value']    , 'function': self.__get_switch_value},
-                    'audio_average'             :{'fmt': 'audio avg     : {:.2f}'                           , 'type': 27 , 'si': False, 'units': 'count'            , 'function': self.__get_default},
-                    'audio_max'                 :{'fmt': 'audio max     : {:.2f}'                           , 'type': 28 , 'si': False, 'units': 'count'            , 'function': self.__get_default},
-                    'audio_spl'                 :{'fmt': 'audio spl     : {:.2f}'                           , 'type': 29 , 'si': False, 'units': 'dB'               , 'function': self.__get_default},
-                    'ambient_light_visible'     :{'fmt': 'ambient light : {:2f}'                            , 'type': 30 , 'si': False, 'units': 'lux'              , 'function': self.__get_ambient_light},
-                    'ambient_light_ir'          :{'fmt': 'ambient ir    : {:2f}'                            , 'type': 31 , 'si': False, 'units': 'lux'              , 'function': self.__get_default},
-                    'ambient_light_uv'          :{'fmt': 'uv index      : {:d}'                             , 'type': 32 , 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'co2_level'                 :{'fmt': 'co2 level     : {:d}'                             , 'type': 33 , 'si': False, 'units': 'g'                , 'function': self.__get_default},
-                    'distance'                  :{'fmt': 'distance      : {:d}'                             , 'type': 34 , 'si': False, 'units': 'mm'               , 'function': self.__get_distance},
-                    'sample_rate'               :{'fmt': 'sample rate   : {:2d}'                            , 'type': 35 , 'si': False, 'units': 'msec'             , 'function': self.__get_default},
-
-                    'magnetometer'              :{'fmt': 'magnetometer  : {:2d}'                            , 'type': 40 , 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'fft_data'                  :{'fmt': 'fft_data      : {:2d}'                            , 'type': 41 , 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'gpio_value'                :{'fmt': 'gpio value    : {:2d}'                            , 'type': 42 , 'si': False, 'units': ''                 , 'function': self.__get_gpio_value},
-                    'voc_iaq'                   :{'fmt': 'iaq           : {:2d}, {:d}'                      , 'type': 43 , 'si': False, 'units': ['index', 'state'] , 'function': self.__get_voc_iaq},
-                    'voc_temperature'           :{'fmt': 'temperature   : {:2f}'                            , 'type': 44 , 'si': False, 'units': 'C'                , 'function': self.__get_voc_temperature},
-                    'voc_humidity'              :{'fmt': 'humidity      : {:2f}'                            , 'type': 45 , 'si': False, 'units': 'RH%'              , 'function': self.__get_voc_humidity},                                        
-                    'voc_pressure'              :{'fmt': 'pressure      : {:2f}'                            , 'type': 46 , 'si': False, 'units': 'pA'               , 'function': self.__get_voc_pressure},
-                    'voc_ambient_light'         :{'fmt': 'ambient light : {:2f}'                            , 'type': 47 , 'si': False, 'units': 'lux'              , 'function': self.__get_voc_ambient_light},
-                    'voc_sound_level'           :{'fmt': 'sound level   : {:2f}'                            , 'type': 48 , 'si': False, 'units': 'dbSpl'            , 'function': self.__get_voc_sound_level},
-                    'tof_distance'              :{'fmt': 'distance      : {:2d}, {:d}'                      , 'type': 49 , 'si': False, 'units': ['mm', 'state']    , 'function': self.__get_tof_distance},   
-                    'accelerometer_status'      :{'fmt': 'acc. status   : {:2d}'                            , 'type': 50 , 'si': False, 'units': 'state'            , 'function': self.__get_default},                    
-                    'gps'                       :{'fmt': 'gps           : {:2d}'                            , 'type': 51 , 'si': False, 'units': 'state'            , 'function': self.__get_default},                    
-                    'voltage'                   :{'fmt': 'voltage       : {:.2f}'                           , 'type': 52 , 'si': False, 'units': 'V'                , 'function': self.__get_terminal_voltage},
-                    'voltage_diff'              :{'fmt': 'voltage diff  : {:.2f}'                           , 'type': 53 , 'si': False, 'units': 'V'                , 'function': self.__get_terminal_voltage_diff},
-                    'voltage_ref'               :{'fmt': 'voltage vref  : {:.2f}'                           , 'type': 54 , 'si': False, 'units': 'V'                , 'function': self.__get_terminal_voltage},
-
-                    'advertisement'             :{'fmt': 'advertisement : {:d}'                             , 'type': 100, 'si': False, 'units': ''                 , 'function': self.__get_default},
-
-                    'stream_start'              :{'fmt': 'stream start  : {:d}'                             , 'type': 121, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'stream_stop'               :{'fmt': 'stream stop   : {:d}'                             , 'type': 122, 'si': False, 'units': ''                 , 'function': self.__get_default},
-
-                    'value_raw'                 :{'fmt': 'raw value     : {:d}'                             , 'type': 123, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'app_sw_ver'                :{'fmt': 'sw ver        : {:d}.{:d}.{:d}'                   , 'type': 124, 'si': False, 'units': ''                 , 'function': self.__get_sw_version},
-                    'driver_resp'               :{'fmt': 'drv response  : {:d}'                             , 'type': 125, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'packet_ack'                :{'fmt': 'ack packet id : {:d}'                             , 'type': 126, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'error_code'                :{'fmt': 'error code    : {:d}'                             , 'type': 127, 'si': False, 'units': ''                 , 'function': self.__get_error_code},
-                    'crc_code'                  :{'fmt': 'crc 16        : 0x{:x}'                           , 'type': 128, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'shutdown'                  :{'fmt': 'shutdown      : {:d}'                             , 'type': 129, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'variable_length'           :{'fmt': 'varlen        : {:d}'                             , 'type': 130, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'device_id'                 :{'fmt': 'device id     : {:d}'                             , 'type': 131, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'device_pin'                :{'fmt': 'device pin    : {:d}'                             , 'type': 132, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'rssi_level'                :{'fmt': 'rssi level    : {:d}'                             , 'type': 133, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'cell_id'                   :{'fmt': 'cell id       : {:d}'                             , 'type': 134, 'si': False, 'units': ''                 , 'function': self.__get_default},
-                    'config_ver'                :{'fmt': 'config ver    : {:d}'                             , 'type': 135, 'si': False, 'units': ''                 , 'function': self.__get_default}
-                }
-
-        self.sensors = [
-                    'SENSOR_NO_SENSOR',             #0
-                    'SENSOR_SI7050_TEMP',           #1
-                    'SENSOR_SI7020_HUMIDITY',       #2
-                    'SENSOR_SWITCH',                #3
-                    'SENSOR_INTERNAL_ADC',          #4
-                    'SENSOR_LTC1864L_ADC',          #5
-                    'SENSOR_420MA_LOOP',            #6
-                    'SENSOR_UART',                  #7
-                    'SENSOR_ACCELEROMETER',         #8
-                    'SENSOR_DIGITAL_MIC',           #9
-                    'SENSOR_AMBIENT_LIGHT',         #10
-                    'SENSOR_CO2_MODULE',            #11
-                    'SENSOR_CUSTOM_1',              #12
-                    'SENSOR_CUSTOM_2',              #13
-                    'SENSOR_CUSTOM_3',              #14
-                    'SENSOR_CUSTOM_4',              #15
-                    'SENSOR_DEBUG',                 #16
-                    'SENSOR_ENVIRONMENTAL',         #17
-                    'SENSOR_GPS',                   #18
-                    'SENSOR_TERMINAL',              #19
-                    'SENSOR_TOF',                   #20
-                    'SENSOR_PIR',                   #21
-                    'SENSOR_CAPA',                  #22
-                    'SENSOR_SONAR'                  #23
-        ]
-
-        self.errors = [
-                'No Error',
-                'Generic Error',
-                'No Resources',
-                'Invalid value',
-                'Timeout',
-                'Object not found',
-                'Invalid state',
-                'Hardware error',
-                'Device busy',
-                'Corrupted resource',
-                'Resource in use',
-                'Comparison error',
-                'Readonly resource',
-                'Flash erase',
-                'Read error',
-                'Write error',
-                'Resource already exists',
-                'Not supported',
-                'Invalid size',
-                'Invalid type',
-                'Unknown parameter',
-                'Access denied',
-                'Low voltage',
-        ]
+        self.projection = None          # measurement selection, see Projection
+        self.__export   = None          # export result of the current packet
 
     def __str__ (self):
         msg  = ''
@@ -188,10 +740,9 @@ class vicpack:
             msg += '+--+ eop'
         else:
             msg += time.strftime(self.timefmt) + ', '
-            msg += 'mac: ' + self.get_mac () + ', '
             msg += 'index: {:03d}, '.format(self.id)
             msg += 'measurements: {:02d}'.format(self.meas) + ', '
-            msg += 'size: {} bytes'.format(len(self.pck['payload']))
+            msg += 'size: {} bytes'.format(self.size)
         return msg
 
     def set (self, param, value):
@@ -225,23 +776,26 @@ class vicpack:
         else:
             pass
 
-    def add (self, string):
+    def add (self, payload, binary=None):
         """
         @brief              Adds packet for processing 
-        @param  payload     Expects string of bytes.
+        @param  payload     Expects string of bytes, either as hex text or the raw
+                            binary frame (str, bytes, bytearray or memoryview).
                             For example: .add ("fa0101000301100002012a000000002a00000000ced399")
+        @param  binary      Payload format, see payload_buffer, detected when None
         @retval             None
         """
-        array = list()
-        for a in range(0, len(string), 2):
-            elem = ''.join([string[a], string[a+1]])
-            array.append(int(elem,16))
-
-        self.pck        = list (array)
+        if metrics.enabled:
+            start = metrics.clock()
+        self.pck        = payload_buffer(payload, binary)
         self.id         = self.pck[PACKET_INDEX]
         self.requestId  = self.pck[PACKET_REQUESTID]
         self.meas       = self.pck[PACKET_MEAS] 
         self.size       = len(self.pck)
+        self.__export   = None
+        if metrics.enabled:
+            metrics.observe(metrics.STAGE_ADD, metrics.clock() - start)
+            metrics.observe_packet(self.size, self.meas)
 
     def get_id (self):
     	"""
@@ -250,88 +804,57 @@ class vicpack:
     	return self.id
 
 
-    def export (self):
-        export = {
-            'sensors'   : list(),
-            'time'      : dict(),
-            'packetId'  : self.id,
-            'requestId' : self.requestId
-        }
+    def project (self, types=None, keys=None, sensors=None):
+        """
+        @brief              Limits decoding to the selected measurements, others are
+                            skipped by their type byte without being converted.
+                            Without arguments the projection is removed.
+        @param  types       Iterable of type codes
+        @param  keys        Iterable of measurement keys, e.g. 'temperature'
+        @param  sensors     Iterable of sensor types, e.g. 'SENSOR_TOF'
+        @retval             None
+        """
+        if types is None and keys is None and sensors is None:
+            self.projection = None
+        else:
+            self.projection = Projection(types, keys, sensors)
+        self.__export = None
 
-        _sensor = {
-            'slot'          : DEFAULT_SLOT,
-            'sensorType'    : DEFAULT_SENSOR_TYPE,
-            'index'         : 0,
-            'measurements'  : list()
-        }
-        meas = 0     # current measurement being processed
-        data = 0     # payload
-        typ  = 0     # type of payload
-        done = False
-        # check if packet contains driver type payload
-        (typ, data) = self.__get_meas(meas)
-        if typ != DRIVER_TYPE:
-            # create fake slot
-            val = dict(_sensor)
-        new = False
-        while not done:
-            (typ, data) = self.__get_meas (meas)
-            if typ == DRIVER_TYPE:
-                # append slot to export previous result
-                if new:
-                    export['sensors'].append (val)
-                    new = False
-                # start new slot
-                val = dict (_sensor)
-                (self.slot, self.driver, self.index, self.enabled) = self.__get_driver_info(data)
-                val['slot'] = self.slot
-                val['sensorType'] = self.sensors[self.driver]
-                val['index'] = self.index
-                val['measurements'] = list()
-                new = True
-            else:
-                val['measurements'].append(self.__get_json(typ, data))
+    def iter_measurements (self, drivers=False):
+        """
+        @brief              Walks the packet and yields one Measurement per
+                            measurement, in packet order, see iter_packet.
+                            Keeps slot, driver, index and enabled of the
+                            instance up to date while walking.
+        @param  drivers     Also yield the driver_info entries which start a
+                            new slot, these carry the new slot context
+        @retval             Generator of Measurement records
+        """
+        for rec in iter_packet(self.pck, self.projection, True):
+            if rec.type == DRIVER_TYPE:
+                (self.slot, self.driver, self.index, self.enabled) = rec.value
+                if not drivers:
+                    continue
+            yield rec
 
-            # increment to next measurement
-            if (meas + 1) > self.meas - 1:
-                # append last result
-                export['sensors'].append(val)
-                done = True
-            else:
-                meas += 1
-        return export
+    def export (self):
+        """
+        @brief              Returns the packet as json styled dictionary. The packet
+                            is decoded once, later calls return the same dictionary
+                            until another packet is added.
+        """
+        if self.__export is not None:
+            return self.__export
+        if metrics.enabled:
+            start = metrics.clock()
+        self.__export = build_export(self.iter_measurements(drivers=True), self.id, self.requestId)
+        if metrics.enabled:
+            metrics.observe(metrics.STAGE_EXPORT, metrics.clock() - start)
+        return self.__export
 
 
     def __get_meas (self, num):
-        type_off = PACKET_OFFSET * num + PACKET_HEADER
-        data_off = type_off + 1
-        data_type = self.pck[type_off]
-        data = 0
-        for i in range(3, -1, -1):
-            data |= self.pck[data_off + (3 - i)] << (i * 8)
-        return (data_type, data) 
-
-    def __get_json (self, typ, data):
-        """
-        Returns json styled dictionary which contains a single 
-        measurement
-        """
-        raw = {
-            'key'   : 'n/a',
-            'value' : '0',
-            'unit'  : 'n/a'
-        }
-        for k,v in self.types.items():
-            if v['type'] == typ:
-                raw['key']  = str(k)    
-                # cast units to list if not defined
-                # as list to avoid having mutable types
-                if type(v['units']) == type(list()):           
-                    raw['unit'] = v['units']
-                else:
-                    raw['unit'] = [v['units']]
-                raw['value']= self.types[k]['function'](data)
-        return raw
+        return MEASUREMENT.unpack_from(self.pck, PACKET_OFFSET * num + PACKET_HEADER)
 
     def __get_str (self, typ, data):
         """
@@ -339,34 +862,33 @@ class vicpack:
         """
         si = tuple()
         res = 0
-        ok = False
-        for k,v in self.types.items():
-            if v['type'] == typ:
-                if typ == DRIVER_TYPE:
-                    msg  = '+--+ '
-                else:
-                    msg  = '|  +-- '
-                # parse multiple arguments, if available
-                if self.types[k]['si'] and self.prefix:
-                    res = self.types[k]['function'](data)
-                    si  = self.__get_si(res)
-                    msg += v['fmt'].format(si[0])
-                    msg += ' {}{}'.format(si[1], v['units'])
-                else:
-                    msg += v['fmt'].format(*self.types[k]['function'](data)) 
-                    msg += ' '
-                    # parse multiple units if necessary
-                    if type(v['units']) == type(list()):
-                        msg += ', '.join(v['units'])
-                    else:
-                        msg += v['units']                        
-                # set flag that measurment has been found
-                ok = True
-        if not ok:
+        entry = TYPE_TABLE[typ]
+        if entry is None:
             return ''
+        (k, v) = entry
+        if typ == DRIVER_TYPE:
+            msg  = '+--+ '
+        else:
+            msg  = '|  +-- '
+        # parse multiple arguments, if available
+        if v['si'] and self.prefix:
+            res = v['function'](data)
+            si  = self.__get_si(res)
+            msg += v['fmt'].format(si[0])
+            msg += ' {}{}'.format(si[1], v['units'])
+        else:
+            res = v['function'](data)
+            msg += v['fmt'].format(*(res if type(res) == tuple else (res,)))
+            msg += ' '
+            # parse multiple units if necessary
+            if type(v['units']) == type(list()):
+                msg += ', '.join(v['units'])
+            else:
+                msg += v['units']
         return msg
 
     def __get_time (self, msb, lsb, offset):
+        import datetime     # only needed for dumps with sampling time
         sample_time = (msb << 32) | (lsb << 0)
         time_str = datetime.datetime.fromtimestamp(
           sample_time
@@ -381,7 +903,7 @@ class vicpack:
     def __get_si (self, val):
         incPrefixes = ['k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y']
         decPrefixes = ['m', 'u', 'n', 'p', 'f', 'a', 'z', 'y']
-        num = val[0]
+        num = val
 
         if num != 0:
             degree = int(math.floor(math.log10(math.fabs(num)) / 3))
@@ -412,155 +934,3 @@ class vicpack:
             scaled = num
 
         return (scaled, prefix)
-
-    def __get_sw_version (self, measurement):
-        """
-        @brief                  Parses application version
-
-        @param  measurement     Measurement containing encoded firmware version
-
-        @retval                 Returns array of numeric measurements
-        """        
-        major = ( measurement >> 16 ) & int("FF", 16)
-        minor = ( measurement >>  8 ) & int("FF", 16)
-        patch = ( measurement >>  0 ) & int("FF", 16)
-        return [major, minor, patch]
-
-    def __get_driver_info (self, measurement):
-        """
-        @brief                  Returns driver information state
-
-        @param  measurement     Measurement containing encoded driver info
-
-        @retval                 Returns array of numeric measurements
-        """          
-        driver  = measurement >> 24
-        slot    = (measurement & int('0x00FF0000', 16)) >> 16
-        index   = (measurement & int('0x0000FF00', 16)) >> 8
-        enabled = (measurement & int('0x000000FF', 16))
-
-        if enabled == 0:
-            enabled = False
-        else:
-            enabled = True
-
-        return [slot, driver, index, enabled]
-
-    def __get_ondie_voltage (self, measurement):
-        voltage = (measurement) / 1000.0
-        return [voltage]
-
-    def __get_battery_voltage (self, measurement):
-        voltage = measurement / 1000000.0
-        return [voltage]
-
-    def __get_ondie_temperature (self, measurement):
-        num = ctypes.c_int16(measurement)
-        temp = (num.value) / 100.0
-        return [temp,]
-
-    def __get_distance (self, measurement):
-        return [measurement, ]
-
-    def __get_external_temperature (self, measurement):
-        temp = (measurement) * 175.72/65536 - 46.85
-        return [temp,]
-
-    def __get_external_humidity (self, measurement):
-        humid = (measurement) * 125/65536.0 - 6
-        return [humid,]
-
-    def __get_switch_value (self, measurement):
-        pin   = measurement >> 8
-        value = measurement & 255
-        return [pin, value]
-
-    def __get_gpio_value (self, measurement):
-        return [measurement,]
-
-    def __get_acceleration (self, measurement):
-        num = ctypes.c_int16(measurement).value
-        acc = (num >> 6) * 0.0039
-        return [acc,]
-
-    def __get_charge       (self, measurement):
-        print(measurement)
-        num = ctypes.c_uint16(measurement).value
-        return [num,]                
-
-    def __get_ext_current (self, measurement):
-        return [measurement * 0.0000322911,]
-
-    def __get_ext_voltage (self, measurement):
-        return [measurement * 0.0484438,]
-
-    def __get_ambient_light (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        exp = measurement >> 12  # get exponent
-        man = measurement & 4095 # get mantissa
-        lux = 0.01 * (2**exp) * man 
-        return [lux,]           
-
-    def __get_error_code (self, measurement):
-        error = ctypes.c_int32(measurement).value * (-1)
-        return [error, ]
-
-    def __get_default (self, measurement):
-        return  [measurement,]
-
-    def __get_voc_iaq (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        iaq_state = ( measurement >> 14 ) & 3
-        iaq_index = ( measurement & int('0x3FFF',16) )        
-        return [iaq_index, iaq_state]
-
-    def __get_voc_temperature (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)        
-        temp = measurement & int ('0xFFFF', 16)
-        temp = temp / 10.0
-        return [temp,]
-
-    def __get_voc_humidity (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        humidity = measurement & int ('0xFFFF', 16)
-        humidity = measurement / 100.0        
-        return [humidity,]
-
-    def __get_voc_pressure (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        pressure = measurement & int ('0xFFFF', 16)
-        pressure = pressure * 10.0           
-        return [pressure,]             
-
-    def __get_voc_ambient_light (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        exp = measurement >> 12  # get exponent
-        man = measurement & 4095 # get mantissa
-        lux = 0.01 * (2**exp) * man 
-        return [lux,]               
-
-    def __get_voc_sound_level (self, measurement):    
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        rf    = 82000.0
-        rs    = 1000.0
-        vref  = 11.23 # mV/pa (peak)
-        vmic  = -((2 ** (-1 - 16) * rs * 3.0 * (2 ** 16 - 2 * measurement )) / rf)
-        try:
-        	dbspl = 20 * math.log10 ( vmic / vref) + (-42) + 94
-        except:
-        	dbspl = 0
-        return [dbspl,]
-
-    def __get_tof_distance (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        tof_state = (measurement >> 13 ) & 7
-        tof_distance = ( measurement & int('0x1FFF',16) )        
-        return [tof_distance, tof_state]    
-
-    def __get_terminal_voltage (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        return [measurement * (3.0/(2**16)),]
-
-    def __get_terminal_voltage_diff (self, measurement):
-        measurement = ((measurement >> 8)&255) | ((measurement & 255)<<8)
-        return [measurement * (3.0/(2**15)),]
\ No newline at end of file